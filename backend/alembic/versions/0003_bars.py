@@ -0,0 +1,44 @@
+"""bar store
+
+Revision ID: 0003_bars
+Revises: 0002_watchlist
+Create Date: 2026-10-18 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_bars"
+down_revision: Union[str, None] = "0002_watchlist"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bars",
+        sa.Column("symbol", sa.String(length=16), nullable=False),
+        sa.Column("timeframe", sa.String(length=8), nullable=False),
+        sa.Column("t", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("o", sa.Float(), nullable=False),
+        sa.Column("h", sa.Float(), nullable=False),
+        sa.Column("l", sa.Float(), nullable=False),
+        sa.Column("c", sa.Float(), nullable=False),
+        sa.Column("v", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("symbol", "timeframe", "t"),
+    )
+    op.create_table(
+        "bar_series",
+        sa.Column("symbol", sa.String(length=16), nullable=False),
+        sa.Column("timeframe", sa.String(length=8), nullable=False),
+        sa.Column("covered_from", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("synced_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("symbol", "timeframe"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("bar_series")
+    op.drop_table("bars")
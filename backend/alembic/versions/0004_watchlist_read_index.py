@@ -0,0 +1,29 @@
+"""covering index for watchlist reads
+
+Revision ID: 0004_watchlist_read_index
+Revises: 0003_bars
+Create Date: 2026-10-18 00:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_watchlist_read_index"
+down_revision: Union[str, None] = "0003_bars"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_watchlist_user_created",
+        "watchlist_items",
+        ["user_id", sa.text("created_at DESC")],
+        postgresql_include=["symbol"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_watchlist_user_created", table_name="watchlist_items")
@@ -1,15 +1,89 @@
+import asyncio
+import logging
+import math
+from typing import Set
+
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
-from app.core.security import decode_token
-from app.db.session import get_session
+from app.core.config import settings
+from app.core.security import decode_token, decode_token_claims
+from app.core.token_cache import TokenCache
+from app.db.session import get_session, get_sessionmaker
 from app.models import User
+from app.services import redis_client
+from app.services.rate_limit import take_client_token
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
 ACCESS_COOKIE_NAME = "access_token"
 
+logger = logging.getLogger(__name__)
+
+token_cache = TokenCache(settings.token_cache_max_entries, settings.token_cache_ttl_seconds)
+
+# Published on the cache invalidation channel when a user is deleted, so every worker drops the
+# user's cached tokens rather than resolving them until they expire.
+USER_INVALIDATION_PREFIX = "user:"
+_DELETED_USERS = "deleted_user_ids"
+_evictions: Set[asyncio.Task] = set()
+
+
+def _evict_user_tokens(key: str) -> None:
+    if key.startswith(USER_INVALIDATION_PREFIX):
+        token_cache.invalidate_user(int(key[len(USER_INVALIDATION_PREFIX) :]))
+
+
+redis_client.on_invalidation(_evict_user_tokens)
+
+
+async def forget_user(user_id: int) -> None:
+    """
+    Drop a deleted user's cached tokens in every worker. ORM deletes call this on commit; bulk
+    DELETE statements bypass ORM events, so callers issuing them should await it themselves.
+    """
+    token_cache.invalidate_user(user_id)
+    await redis_client.invalidate(f"{USER_INVALIDATION_PREFIX}{user_id}")
+
+
+async def _publish_forget_user(user_id: int) -> None:
+    try:
+        await forget_user(user_id)
+    except Exception:
+        logger.warning("Could not publish the deletion of user %s", user_id, exc_info=True)
+
+
+@event.listens_for(User, "after_delete")
+def _record_deleted_user(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_DELETED_USERS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_deleted_users(session: Session) -> None:
+    # Only once the row is gone: evicting earlier would let a worker re-cache the token before the
+    # commit, for another TOKEN_CACHE_TTL_SECONDS.
+    user_ids = session.info.pop(_DELETED_USERS, ())
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:  # a synchronous session, e.g. in a maintenance script
+        if user_ids:
+            logger.warning("Deleted users %s outside the event loop; call forget_user for them", sorted(user_ids))
+        return
+    for user_id in user_ids:
+        eviction = loop.create_task(_publish_forget_user(user_id))
+        _evictions.add(eviction)
+        eviction.add_done_callback(_evictions.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_rolled_back_users(session: Session) -> None:
+    session.info.pop(_DELETED_USERS, None)
+
 
 async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
@@ -28,16 +102,29 @@ async def get_current_user_from_cookie(
     return await _resolve_user_from_token(token, session)
 
 
-async def get_user_id_optional(request: Request, session: AsyncSession = Depends(get_session)) -> int:
+async def get_user_id_optional(request: Request) -> int:
     """
     Attempt to read user id from access token cookie; fall back to 1 if not authenticated.
+    Verified tokens are cached, so only the first request per token touches the database.
     """
     token = request.cookies.get(ACCESS_COOKIE_NAME)
-    try:
-        user = await _resolve_user_from_token(token, session)
-        return user.id
-    except HTTPException:
+    if not token:
         return 1
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    claims = decode_token_claims(token)
+    if claims is None or not claims[0].isdigit():
+        return 1
+    async with get_sessionmaker()() as session:
+        user = await session.get(User, int(claims[0]))
+    if not user:
+        return 1
+    # Deletions reach this worker through the invalidation listener.
+    redis_client.ensure_invalidation_listener()
+    token_cache.set(token, user.id, claims[1])
+    return user.id
 
 
 async def _resolve_user_from_token(token: str | None, session: AsyncSession) -> User:
@@ -50,3 +137,16 @@ async def _resolve_user_from_token(token: str | None, session: AsyncSession) ->
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
+
+
+async def limit_client(request: Request) -> None:
+    """Per-IP token bucket, so one client cannot spend the shared upstream quota."""
+    if settings.market_rate_limit_per_minute <= 0:
+        return
+    wait = await take_client_token(request.client.host if request.client else "unknown")
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
@@ -0,0 +1,174 @@
+"""
+Content negotiation for market data responses.
+
+Besides JSON, quotes and charts can be sent columnar, as parallel arrays instead of one object
+per row, in one of two encodings chosen through the Accept header:
+
+- application/msgpack: a map of arrays. Charts carry "t" (epoch ms) and "c"; quotes carry
+  "symbols" and "last", "mid", "bid", "ask", "changePct", "updatedAt" (epoch ms), with nil
+  where a value is missing.
+- application/vnd.tradelab.f64: an 8-byte header (little-endian uint32 row count, uint32
+  flags, bit 0 set when the data is stale) followed by one little-endian float64 column per
+  field, in the order above (without symbols: quote rows follow the requested symbols), with NaN
+  where a value is missing. Each column can be viewed directly as a JS Float64Array.
+
+Bodies of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed with brotli (when the brotli
+package is installed) or gzip, according to Accept-Encoding.
+"""
+import asyncio
+import gzip
+import struct
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+import numpy as np
+import orjson
+from fastapi import Request, Response
+
+from app.core.config import settings
+from app.services import swr
+from app.services.quotes import quotes_response_body
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip is offered without it
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+FLOAT64 = "application/vnd.tradelab.f64"
+MEDIA_TYPES = (JSON, MSGPACK, FLOAT64)
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+QUOTE_FIELDS = ("last", "mid", "bid", "ask", "changePct")
+FLOAT64_HEADER = struct.Struct("<II")
+FLAG_STALE = 1
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+# Larger bodies are compressed off the event loop.
+COMPRESS_IN_THREAD_BYTES = 64 * 1024
+
+
+def _preferences(header: str) -> Dict[str, float]:
+    preferences: Dict[str, float] = {}
+    for part in header.split(","):
+        value, *params = (piece.strip() for piece in part.split(";"))
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        preferences[value.lower()] = quality
+    return preferences
+
+
+def _best(header: Optional[str], offered: Sequence[str], wildcards: Dict[str, Tuple[str, ...]]) -> Optional[str]:
+    """
+    The offered value the header ranks highest, preferring exact matches over wildcards at the
+    same quality and earlier offers on a tie; None when the header rules them all out.
+    """
+    preferences = _preferences(header or "")
+    best, best_rank = None, (0.0, 0)
+    for value in offered:
+        patterns = (value, *wildcards.get(value, ()))
+        for specificity, pattern in zip(range(len(patterns), 0, -1), patterns):
+            if pattern in preferences:
+                rank = (preferences[pattern], specificity)
+                if rank[0] > 0 and rank > best_rank:
+                    best, best_rank = value, rank
+                break
+    return best
+
+
+MEDIA_TYPE_WILDCARDS = {media: (media.split("/")[0] + "/*", "*/*") for media in MEDIA_TYPES}
+ENCODING_WILDCARDS = {coding: ("*",) for coding in ENCODINGS}
+
+
+# Clients send the same few header values over and over, so each is parsed once.
+@lru_cache(maxsize=256)
+def _media_type_for(header: str) -> str:
+    return _best(header, MEDIA_TYPES, MEDIA_TYPE_WILDCARDS) or JSON
+
+
+@lru_cache(maxsize=256)
+def _encoding_for(header: str) -> Optional[str]:
+    return _best(header, ENCODINGS, ENCODING_WILDCARDS)
+
+
+def negotiate_media_type(request: Request) -> str:
+    """The response format for `request`; JSON when Accept is absent or matches nothing offered."""
+    header = request.headers.get("accept")
+    return _media_type_for(header) if header else JSON
+
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+    header = request.headers.get("accept-encoding")
+    return _encoding_for(header) if header else None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+async def encoded_response(request: Request, body: bytes, media_type: str) -> Response:
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    coding = negotiate_encoding(request) if len(body) >= settings.response_compression_min_bytes else None
+    if coding is not None:
+        if len(body) >= COMPRESS_IN_THREAD_BYTES:
+            body = await asyncio.to_thread(compress, body, coding)
+        else:
+            body = compress(body, coding)
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def epoch_ms(stamps: List[Optional[str]]) -> np.ndarray:
+    """RFC 3339 UTC timestamps as float64 epoch milliseconds, NaN for missing ones."""
+    parsed = np.array([stamp.rstrip("Z") if stamp else "NaT" for stamp in stamps], dtype="datetime64[ns]")
+    ms = parsed.astype("datetime64[ms]").astype(np.int64).astype(np.float64)
+    ms[np.isnat(parsed)] = np.nan
+    return ms
+
+
+def _nullable(values: np.ndarray) -> list:
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _float64_body(columns: List[np.ndarray], rows: int, stale: bool) -> bytes:
+    header = FLOAT64_HEADER.pack(rows, FLAG_STALE if stale else 0)
+    return header + b"".join(np.asarray(column, dtype="<f8").tobytes() for column in columns)
+
+
+def encode_quotes(media_type: str, as_of: str, quotes: Dict[str, bytes], stale: bool) -> bytes:
+    if media_type == JSON:
+        return quotes_response_body(as_of, quotes, stale)
+    rows = [orjson.loads(raw) for raw in quotes.values()]
+    columns = {field: np.array([row.get(field) for row in rows], dtype=np.float64) for field in QUOTE_FIELDS}
+    updated_at = epoch_ms([row.get("updatedAt") for row in rows])
+    if media_type == FLOAT64:
+        return _float64_body([*columns.values(), updated_at], len(rows), stale)
+    document = {"asOf": as_of, "stale": stale, "symbols": list(quotes)}
+    document.update((field, _nullable(column)) for field, column in columns.items())
+    document["updatedAt"] = [None if ms != ms else int(ms) for ms in updated_at.tolist()]
+    return msgpack.packb(document)
+
+
+def encode_chart(media_type: str, body: bytes, stale: bool) -> bytes:
+    """Re-encode a cached JSON chart body in `media_type`."""
+    if media_type == JSON:
+        return swr.with_stale_flag(body) if stale else body
+    chart = orjson.loads(body)
+    points = chart["points"]
+    t = epoch_ms([point["t"] for point in points])
+    c = np.array([point["c"] for point in points], dtype=np.float64)
+    if media_type == FLOAT64:
+        return _float64_body([t, c], len(points), stale)
+    document = {"symbol": chart["symbol"], "asOf": chart["asOf"], "stale": stale}
+    return msgpack.packb({**document, "t": t.astype(np.int64).tolist(), "c": c.tolist()})
@@ -4,7 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import _resolve_user_from_token
 from app.core.config import settings
-from app.core.security import create_token, hash_password, verify_password
+from app.core.security import PasswordHasherBusy, create_token, hash_password_async, verify_password_async
 from app.db.session import get_session
 from app.models import User
 from app.schemas.auth import AuthResponse, UserCreate, UserLogin, UserOut
@@ -42,6 +42,14 @@ def clear_token_cookies(response: Response) -> None:
     response.delete_cookie(COOKIE_REFRESH, path="/")
 
 
+def auth_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/signup", response_model=AuthResponse, status_code=status.HTTP_201_CREATED)
 async def signup(payload: UserCreate, response: Response, session: AsyncSession = Depends(get_session)) -> AuthResponse:
     normalized_email = payload.email.strip().lower()
@@ -49,7 +57,13 @@ async def signup(payload: UserCreate, response: Response, session: AsyncSession
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
 
-    user = User(email=normalized_email, hashed_password=hash_password(payload.password), full_name=payload.full_name)
+    # Ends the read transaction, returning the connection to the pool while bcrypt runs.
+    await session.commit()
+    try:
+        hashed_password = await hash_password_async(payload.password)
+    except PasswordHasherBusy:
+        raise auth_busy()
+    user = User(email=normalized_email, hashed_password=hashed_password, full_name=payload.full_name)
     session.add(user)
     await session.commit()
     await session.refresh(user)
@@ -63,7 +77,13 @@ async def signup(payload: UserCreate, response: Response, session: AsyncSession
 async def signin(payload: UserLogin, response: Response, session: AsyncSession = Depends(get_session)) -> AuthResponse:
     normalized_email = payload.email.strip().lower()
     user = await session.scalar(select(User).where(User.email == normalized_email))
-    if not user or not verify_password(payload.password, user.hashed_password):
+    # Ends the read transaction, returning the connection to the pool while bcrypt runs.
+    await session.commit()
+    try:
+        verified = bool(user) and await verify_password_async(payload.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise auth_busy()
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     access = create_token(str(user.id), settings.access_token_expire_minutes)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from sqlalchemy import text
 
+from app.core import metrics
 from app.db.session import get_engine
 
 router = APIRouter()
@@ -13,3 +15,13 @@ async def health() -> dict[str, str]:
         result = await connection.execute(text("SELECT 1"))
         result.scalar_one()
     return {"status": "ok"}
+
+
+@router.get("/health/stats")
+async def health_stats() -> dict:
+    return metrics.snapshot()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
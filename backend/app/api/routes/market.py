@@ -1,112 +1,144 @@
-from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 import httpx
 
-from app.services.alpaca_client import fetch_assets, fetch_bars, fetch_latest_quotes
-from app.services.redis_client import get_json, set_json
+from app.api.deps import limit_client
+from app.api.encoding import encode_chart, encode_quotes, encoded_response, negotiate_media_type
+from app.core.config import settings
+from app.services.asset_index import get_asset_index
+from app.services.charts import CHART_DEFAULT_LIMIT, CHART_DEFAULT_MAX_POINTS, CHART_RANGES, ChartSpec, load_chart
+from app.services.prewarm import prewarmer
+from app.services.quote_hub import Subscription, quote_hub
+from app.services.quotes import load_quotes_with_staleness, quotes_response_body
+from app.services.symbols import check_symbols, invalid_symbols
 
 router = APIRouter(prefix="/api/market", tags=["market"])
+logger = logging.getLogger(__name__)
 
 
 def _validate_symbols(symbols_param: str) -> List[str]:
     symbols = [s.strip().upper() for s in symbols_param.split(",") if s.strip()]
     if not symbols:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No symbols provided")
+    try:
+        check_symbols(symbols)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     return symbols
 
 
+# Not behind limit_client: search is answered from the in-process index, and a Redis round trip
+# per keystroke would cost more than the lookup. Index rebuilds are shared, not per request.
 @router.get("/search")
 async def search_assets(q: str = Query("", min_length=0)) -> dict:
     q = q.strip()
-    cache_key = "alpaca:assets:us_equity_active"
-    assets = await get_json(cache_key)
-    if assets is None:
-        assets = await fetch_assets()
-        await set_json(cache_key, assets, ttl_seconds=6 * 60 * 60)
-
     if not q:
         return {"results": []}
 
-    q_upper = q.upper()
-    starts = []
-    contains = []
-    for asset in assets:
-        symbol = asset.get("symbol", "").upper()
-        name = asset.get("name") or ""
-        if symbol.startswith(q_upper):
-            starts.append((symbol, name))
-        elif q_upper in symbol:
-            contains.append((symbol, name))
-
-    combined = []
-    seen = set()
-    for sym, name in starts + contains:
-        if sym in seen:
-            continue
-        seen.add(sym)
-        combined.append({"symbol": sym, "name": name})
-        if len(combined) >= 10:
-            break
-
-    return {"results": combined}
-
-
-@router.get("/quotes")
-async def get_quotes(symbols: str = Query(..., description="Comma-separated symbols")) -> dict:
+    index = await get_asset_index()
+    return {"results": index.search(q, limit=10)}
+
+
+@router.get("/quotes", dependencies=[Depends(limit_client)])
+async def get_quotes(request: Request, symbols: str = Query(..., description="Comma-separated symbols")) -> Response:
     parsed = _validate_symbols(symbols)
-    key = ",".join(sorted(parsed))
-    cache_key = f"quotes:delayed_sip:{key}"
-    cached = await get_json(cache_key)
-    if cached is not None:
-        return cached
-
-    data = await fetch_latest_quotes(sorted(parsed))
-    now_iso = datetime.now(timezone.utc).isoformat()
-    quotes: Dict[str, dict] = {}
-    alpaca_quotes = data.get("quotes", {})
-    for sym in parsed:
-        q = alpaca_quotes.get(sym, {}) or {}
-        bid = q.get("bp")
-        ask = q.get("ap")
-        last = None
-        if bid is not None and ask is not None:
-            last = round((bid + ask) / 2, 4)
-        elif ask is not None:
-            last = ask
-        elif bid is not None:
-            last = bid
-        quotes[sym] = {
-            "symbol": sym,
-            "last": last,
-            "bid": bid,
-            "ask": ask,
-            "changePct": None,
-            "updatedAt": q.get("t"),
-        }
-
-    payload = {"asOf": now_iso, "quotes": quotes}
-    await set_json(cache_key, payload, ttl_seconds=20)
-    return payload
-
-
-@router.get("/chart")
-async def get_chart(symbol: str = Query(..., min_length=1)) -> dict:
-    symbol = symbol.strip().upper()
-    cache_key = f"chart:1Hour:24:delayed_sip:{symbol}"
-    cached = await get_json(cache_key)
-    if cached is not None:
-        return cached
-
-    start = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    prewarmer.record_interest(parsed)
+    quotes, stale = await load_quotes_with_staleness(parsed)
+    media_type = negotiate_media_type(request)
+    body = encode_quotes(media_type, datetime.now(timezone.utc).isoformat(), quotes, stale)
+    return await encoded_response(request, body, media_type)
+
+
+def _stream_symbols(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return []
+    return [s.strip().upper() for s in value if isinstance(s, str) and s.strip()]
+
+
+async def _send_quote_updates(websocket: WebSocket, subscription: Subscription) -> None:
+    while True:
+        quotes = await subscription.next_batch()
+        body = quotes_response_body(datetime.now(timezone.utc).isoformat(), quotes)
+        await websocket.send_text('{"type":"quotes",' + body[1:].decode())
+
+
+@router.websocket("/stream")
+async def stream_quotes(websocket: WebSocket, symbols: str = Query("")) -> None:
+    """
+    Push quote changes for subscribed symbols. Clients send
+    {"action": "subscribe" | "unsubscribe", "symbols": [...]}; initial symbols may be passed as a query param.
+    Malformed symbols are answered with {"type": "error", "symbols": [...]} and not subscribed.
+    """
+    await websocket.accept()
+    subscription = quote_hub.connect()
+
+    async def subscribe(requested: List[str]) -> None:
+        invalid = invalid_symbols(requested)
+        if invalid:
+            await websocket.send_json({"type": "error", "detail": "Invalid symbols", "symbols": invalid})
+        room = settings.quote_stream_max_symbols - len(subscription.symbols)
+        accepted = [symbol for symbol in requested if symbol not in invalid][: max(room, 0)]
+        prewarmer.record_interest(accepted)
+        quote_hub.subscribe(subscription, accepted)
+
+    async def receive_commands() -> None:
+        await subscribe(_stream_symbols(symbols))
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except (ValueError, KeyError):  # KeyError: a binary frame has no "text"
+                await websocket.send_json({"type": "error", "detail": "Invalid message"})
+                continue
+            action = message.get("action") if isinstance(message, dict) else None
+            requested = _stream_symbols(message.get("symbols")) if isinstance(message, dict) else []
+            if action == "subscribe":
+                await subscribe(requested)
+            elif action == "unsubscribe":
+                quote_hub.unsubscribe(subscription, requested)
+            else:
+                await websocket.send_json({"type": "error", "detail": "Unknown action"})
+
+    # Whichever side ends first ends the connection, so a failed send cannot leave the receive
+    # loop holding the subscription.
+    sender = asyncio.create_task(_send_quote_updates(websocket, subscription))
+    receiver = asyncio.create_task(receive_commands())
+    try:
+        await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        quote_hub.disconnect(subscription)
+    sent, received = await asyncio.gather(sender, receiver, return_exceptions=True)
+    if isinstance(sent, Exception) and not isinstance(sent, WebSocketDisconnect):
+        logger.warning("Sending quotes to a stream client failed: %r", sent)
+    if isinstance(received, Exception) and not isinstance(received, WebSocketDisconnect):
+        raise received
+
+
+@router.get("/chart", dependencies=[Depends(limit_client)])
+async def get_chart(
+    request: Request,
+    symbol: str = Query(..., min_length=1),
+    range_: Optional[str] = Query(None, alias="range", description=f"One of {', '.join(CHART_RANGES)}"),
+    timeframe: Optional[str] = Query(None),
+    limit: int = Query(CHART_DEFAULT_LIMIT, ge=1, le=1000, description="Number of recent bars when no range is given"),
+    max_points: int = Query(CHART_DEFAULT_MAX_POINTS, ge=3, le=5000),
+) -> Response:
+    try:
+        spec = ChartSpec(symbol.strip().upper(), range_, timeframe, limit, max_points)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    prewarmer.record_interest([spec.symbol])
     try:
-        data = await fetch_bars(symbol, timeframe="1Hour", limit=24, start=start)
+        body, stale = await load_chart(spec)
     except httpx.HTTPStatusError as exc:
         detail = exc.response.text
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Alpaca error: {detail}") from exc
-    bars = data.get("bars", [])
-    points = [{"t": bar.get("t"), "c": bar.get("c")} for bar in bars if bar.get("t") is not None and bar.get("c") is not None]
-    payload = {"symbol": symbol, "asOf": datetime.now(timezone.utc).isoformat(), "points": points}
-    await set_json(cache_key, payload, ttl_seconds=60)
-    return payload
+    media_type = negotiate_media_type(request)
+    return await encoded_response(request, encode_chart(media_type, body, stale), media_type)
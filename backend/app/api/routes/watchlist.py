@@ -1,68 +1,243 @@
-import re
-from typing import List
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
 
-from fastapi import APIRouter, Depends, HTTPException, Path, status
-from sqlalchemy import delete, insert, select
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Request, Response, status
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+import orjson
 
-from app.api.deps import get_user_id_optional
+from app.api.deps import get_user_id_optional, limit_client
 from app.db.session import get_session
 from app.models import WatchlistItem
+from app.services import swr
+from app.services.charts import load_sparklines
+from app.services.prewarm import prewarmer
+from app.services.quotes import load_quotes_with_staleness
+from app.services.symbols import SYMBOL_RE
+from app.services.watchlist_cache import (
+    apply_delta,
+    bump_version,
+    current_version,
+    get_cached_symbols,
+    prewarm_quotes,
+    store_symbols,
+)
 
 router = APIRouter(prefix="/api/watchlist", tags=["watchlist"])
 
-SYMBOL_RE = re.compile(r"^[A-Z0-9\.]{1,16}$")
+BATCH_MAX_SYMBOLS = 1000
 
 
-async def _symbols_for_user(session: AsyncSession, user_id: int) -> List[str]:
+def _normalize_symbol(symbol: Any) -> str:
+    if not isinstance(symbol, str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid symbol")
+    symbol = symbol.strip().upper()
+    if not SYMBOL_RE.match(symbol):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Symbol format invalid")
+    return symbol
+
+
+def _normalize_symbols(symbols: Any) -> List[str]:
+    if symbols is None:
+        return []
+    if not isinstance(symbols, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a list of symbols")
+    return list(dict.fromkeys(_normalize_symbol(symbol) for symbol in symbols))
+
+
+def _etag(version: str) -> str:
+    return f'"{version}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def load_symbols(session: AsyncSession, user_id: int) -> List[str]:
+    # Only touches columns in ix_watchlist_user_created, so Postgres can answer from the index.
     rows = await session.scalars(
         select(WatchlistItem.symbol).where(WatchlistItem.user_id == user_id).order_by(WatchlistItem.created_at.desc())
     )
     return list(rows)
 
 
+async def _symbols_for_user(session: AsyncSession, user_id: int, version: str) -> List[str]:
+    symbols = await get_cached_symbols(user_id, version)
+    if symbols is None:
+        symbols = await load_symbols(session, user_id)
+        # Tagged with the version read before the query: a mutation that lands meanwhile bumps
+        # the version, so this list is never served as current.
+        await store_symbols(user_id, version, symbols)
+    return symbols
+
+
+async def _insert_symbols(session: AsyncSession, user_id: int, symbols: List[str]) -> List[str]:
+    if not symbols:
+        return []
+    # Later symbols in the request count as added later. now() is the transaction's start time,
+    # so each row is offset by its position to keep a batch's newest-first order deterministic
+    # when the list is rebuilt from the table.
+    rows = [
+        {"user_id": user_id, "symbol": symbol, "created_at": func.now() + timedelta(microseconds=position)}
+        for position, symbol in enumerate(symbols)
+    ]
+    stmt = (
+        pg_insert(WatchlistItem)
+        .values(rows)
+        .on_conflict_do_nothing(constraint="uq_watchlist_user_symbol")
+        .returning(WatchlistItem.symbol)
+    )
+    inserted = set(await session.scalars(stmt))
+    # RETURNING order is unspecified. Report newest first, like the list.
+    return [symbol for symbol in reversed(symbols) if symbol in inserted]
+
+
+async def _delete_symbols(session: AsyncSession, user_id: int, symbols: List[str]) -> List[str]:
+    if not symbols:
+        return []
+    stmt = (
+        delete(WatchlistItem)
+        .where(WatchlistItem.user_id == user_id, WatchlistItem.symbol.in_(symbols))
+        .returning(WatchlistItem.symbol)
+    )
+    return list(await session.scalars(stmt))
+
+
+async def _respond(
+    session: AsyncSession,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    user_id: int,
+    added: List[str],
+    removed: List[str],
+) -> dict:
+    if not added and not removed:
+        version = await current_version(user_id)
+        symbols = await _symbols_for_user(session, user_id, version)
+    else:
+        version = await bump_version(user_id)
+        symbols = await apply_delta(user_id, version, added, removed)
+        if symbols is None:
+            symbols = await _symbols_for_user(session, user_id, version)
+        background_tasks.add_task(prewarm_quotes, symbols)
+    response.headers["ETag"] = _etag(version)
+    return {"symbols": symbols, "added": added, "removed": removed}
+
+
 @router.get("")
-async def get_watchlist(session: AsyncSession = Depends(get_session), user_id: int = Depends(get_user_id_optional)) -> dict:
-    symbols = await _symbols_for_user(session, user_id)
+async def get_watchlist(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_user_id_optional),
+):
+    """Conditional GET: an unchanged watchlist costs one Redis read and a bodiless 304."""
+    version = await current_version(user_id)
+    etag = _etag(version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    symbols = await _symbols_for_user(session, user_id, version)
+    response.headers.update(headers)
     return {"symbols": symbols}
 
 
+@router.get("/snapshot", dependencies=[Depends(limit_client)])
+async def get_snapshot(
+    session: AsyncSession = Depends(get_session), user_id: int = Depends(get_user_id_optional)
+) -> Response:
+    """
+    Everything the watchlist view renders in one response: symbols, quotes and hourly sparkline
+    closes, {"asOf", "symbols", "quotes": {sym: quote}, "sparklines": {sym: [close, ...]}}.
+    Cached parts are spliced in as stored bytes; "stale": true marks data still being refreshed.
+    """
+    symbols = await _symbols_for_user(session, user_id, await current_version(user_id))
+    prewarmer.record_interest(symbols)
+    (quotes, quotes_stale), (sparklines, sparklines_stale) = await asyncio.gather(
+        load_quotes_with_staleness(symbols), load_sparklines(symbols)
+    )
+    body = b"".join(
+        (
+            b'{"asOf":',
+            orjson.dumps(datetime.now(timezone.utc).isoformat()),
+            b',"symbols":',
+            orjson.dumps(symbols),
+            b',"quotes":{',
+            b",".join(orjson.dumps(symbol) + b":" + raw for symbol, raw in quotes.items()),
+            b'},"sparklines":{',
+            b",".join(orjson.dumps(symbol) + b":" + raw for symbol, raw in sparklines.items()),
+            b"}}",
+        )
+    )
+    if quotes_stale or sparklines_stale:
+        body = swr.with_stale_flag(body)
+    return Response(content=body, media_type="application/json")
+
+
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def add_symbol(
-    payload: dict, session: AsyncSession = Depends(get_session), user_id: int = Depends(get_user_id_optional)
+    payload: dict,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_user_id_optional),
 ) -> dict:
-    symbol = payload.get("symbol", "")
-    if not isinstance(symbol, str):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid symbol")
-    symbol = symbol.strip().upper()
-    if not SYMBOL_RE.match(symbol):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Symbol format invalid")
+    symbol = _normalize_symbol(payload.get("symbol", ""))
+    added = await _insert_symbols(session, user_id, [symbol])
+    await session.commit()
+    return await _respond(session, response, background_tasks, user_id, added, [])
 
-    stmt = insert(WatchlistItem).values(user_id=user_id, symbol=symbol)
-    try:
-        await session.execute(stmt)
-        await session.commit()
-    except IntegrityError:
-        await session.rollback()
-    symbols = await _symbols_for_user(session, user_id)
-    return {"symbols": symbols}
+
+@router.post("/batch")
+async def batch_update(
+    payload: dict,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
+    user_id: int = Depends(get_user_id_optional),
+) -> dict:
+    """
+    Add and remove many symbols in one transaction: {"add": [...], "remove": [...]}.
+    Removals are applied first, so a symbol listed in both ends up on the watchlist.
+    """
+    to_add = _normalize_symbols(payload.get("add"))
+    to_remove = _normalize_symbols(payload.get("remove"))
+    if len(to_add) + len(to_remove) > BATCH_MAX_SYMBOLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {BATCH_MAX_SYMBOLS} symbols per batch"
+        )
+    removed = await _delete_symbols(session, user_id, to_remove)
+    added = await _insert_symbols(session, user_id, to_add)
+    await session.commit()
+    return await _respond(session, response, background_tasks, user_id, added, removed)
 
 
 @router.delete("/{symbol}")
 async def delete_symbol(
+    response: Response,
+    background_tasks: BackgroundTasks,
     symbol: str = Path(..., description="Symbol to remove"),
     session: AsyncSession = Depends(get_session),
     user_id: int = Depends(get_user_id_optional),
 ) -> dict:
-    await session.execute(delete(WatchlistItem).where(WatchlistItem.user_id == user_id, WatchlistItem.symbol == symbol.upper()))
+    removed = await _delete_symbols(session, user_id, [symbol.upper()])
     await session.commit()
-    symbols = await _symbols_for_user(session, user_id)
-    return {"symbols": symbols}
+    return await _respond(session, response, background_tasks, user_id, [], removed)
 
 
 @router.delete("")
-async def clear_watchlist(session: AsyncSession = Depends(get_session), user_id: int = Depends(get_user_id_optional)) -> dict:
+async def clear_watchlist(
+    response: Response, session: AsyncSession = Depends(get_session), user_id: int = Depends(get_user_id_optional)
+) -> dict:
     await session.execute(delete(WatchlistItem).where(WatchlistItem.user_id == user_id))
     await session.commit()
+    version = await bump_version(user_id)
+    await store_symbols(user_id, version, [])
+    response.headers["ETag"] = _etag(version)
     return {"symbols": []}
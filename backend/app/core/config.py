@@ -6,16 +6,56 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     database_url: str = Field(..., alias="DATABASE_URL")
+    db_pool_size: int = Field(10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(10, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(10.0, alias="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(1800, alias="DB_POOL_RECYCLE")
+    db_pool_pre_ping: bool = Field(False, alias="DB_POOL_PRE_PING")
+    db_pool_warm_connections: int = Field(2, alias="DB_POOL_WARM_CONNECTIONS")
     cors_origins: Union[str, List[str]] = Field(default_factory=list, alias="CORS_ORIGINS")
     secret_key: str = Field("changeme", alias="SECRET_KEY")
     access_token_expire_minutes: int = Field(30, alias="ACCESS_TOKEN_EXPIRE_MINUTES")
     refresh_token_expire_minutes: int = Field(60 * 24 * 7, alias="REFRESH_TOKEN_EXPIRE_MINUTES")
     algorithm: str = Field("HS256", alias="ALGORITHM")
+    token_cache_max_entries: int = Field(10000, alias="TOKEN_CACHE_MAX_ENTRIES")
+    token_cache_ttl_seconds: float = Field(300.0, alias="TOKEN_CACHE_TTL_SECONDS")
+    password_hash_workers: int = Field(2, alias="PASSWORD_HASH_WORKERS")
+    password_hash_max_queue: int = Field(32, alias="PASSWORD_HASH_MAX_QUEUE")
     alpaca_key_id: str = Field("", alias="APCA_API_KEY_ID")
     alpaca_secret_key: str = Field("", alias="APCA_API_SECRET_KEY")
     alpaca_data_base: str = Field("https://data.alpaca.markets", alias="ALPACA_DATA_BASE")
     alpaca_trade_base: str = Field("https://paper-api.alpaca.markets", alias="ALPACA_TRADE_BASE")
+    alpaca_http_timeout: float = Field(10.0, alias="ALPACA_HTTP_TIMEOUT")
+    alpaca_http_pool_timeout: float = Field(5.0, alias="ALPACA_HTTP_POOL_TIMEOUT")
+    alpaca_http_max_connections: int = Field(20, alias="ALPACA_HTTP_MAX_CONNECTIONS")
+    alpaca_http_max_keepalive: int = Field(10, alias="ALPACA_HTTP_MAX_KEEPALIVE")
+    alpaca_http_keepalive_expiry: float = Field(30.0, alias="ALPACA_HTTP_KEEPALIVE_EXPIRY")
+    alpaca_http2: bool = Field(True, alias="ALPACA_HTTP2")
+    alpaca_bulk_max_concurrency: int = Field(4, alias="ALPACA_BULK_MAX_CONCURRENCY")
+    # A bucket of 20 refilling at 180/min never exceeds Alpaca's 200 requests in any minute.
+    alpaca_rate_limit_per_minute: float = Field(180.0, alias="ALPACA_RATE_LIMIT_PER_MINUTE")
+    alpaca_rate_limit_burst: float = Field(20.0, alias="ALPACA_RATE_LIMIT_BURST")
+    alpaca_rate_limit_background_reserve: float = Field(0.5, alias="ALPACA_RATE_LIMIT_BACKGROUND_RESERVE")
+    alpaca_rate_limit_max_wait: float = Field(5.0, alias="ALPACA_RATE_LIMIT_MAX_WAIT")
+    alpaca_rate_limit_background_max_wait: float = Field(30.0, alias="ALPACA_RATE_LIMIT_BACKGROUND_MAX_WAIT")
+    market_rate_limit_per_minute: float = Field(300.0, alias="MARKET_RATE_LIMIT_PER_MINUTE")
+    market_rate_limit_burst: float = Field(60.0, alias="MARKET_RATE_LIMIT_BURST")
     redis_url: str = Field("redis://redis:6379/0", alias="REDIS_URL")
+    redis_max_connections: int = Field(50, alias="REDIS_MAX_CONNECTIONS")
+    redis_pool_timeout: float = Field(2.0, alias="REDIS_POOL_TIMEOUT")
+    redis_socket_timeout: float = Field(2.0, alias="REDIS_SOCKET_TIMEOUT")
+    redis_socket_connect_timeout: float = Field(2.0, alias="REDIS_SOCKET_CONNECT_TIMEOUT")
+    redis_health_check_interval: float = Field(30.0, alias="REDIS_HEALTH_CHECK_INTERVAL")
+    cache_l1_max_entries: int = Field(2048, alias="CACHE_L1_MAX_ENTRIES")
+    cache_l1_max_ttl_seconds: float = Field(300.0, alias="CACHE_L1_MAX_TTL_SECONDS")
+    cache_l1_invalidation: bool = Field(True, alias="CACHE_L1_INVALIDATION")
+    response_compression_min_bytes: int = Field(1024, alias="RESPONSE_COMPRESSION_MIN_BYTES")
+    quote_stream_interval_seconds: float = Field(5.0, alias="QUOTE_STREAM_INTERVAL_SECONDS")
+    quote_stream_max_symbols: int = Field(200, alias="QUOTE_STREAM_MAX_SYMBOLS")
+    prewarm_enabled: bool = Field(True, alias="PREWARM_ENABLED")
+    prewarm_interval_seconds: float = Field(15.0, alias="PREWARM_INTERVAL_SECONDS")
+    prewarm_top_symbols: int = Field(50, alias="PREWARM_TOP_SYMBOLS")
+    prewarm_upstream_budget: int = Field(10, alias="PREWARM_UPSTREAM_BUDGET")
 
     model_config = SettingsConfigDict(env_file=".env", env_prefix="", extra="ignore")
 
@@ -0,0 +1,171 @@
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(names: Tuple[str, ...], labels: Dict[str, Any]) -> LabelValues:
+    return tuple(str(labels[name]) for name in names)
+
+
+def _format_key(key: LabelValues) -> str:
+    return ",".join(key) or "total"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], key: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(self.labels, labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        return {_format_key(key): value for key, value in self._values.items()}
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in self._values.items()]
+
+
+class Histogram:
+    def __init__(
+        self, name: str, description: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: non-cumulative bucket counts (last slot is +Inf), then count and sum.
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(self.labels, labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0.0] * (len(self.buckets) + 3)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += 1
+        state[-1] += value
+
+    def timer(self, **labels: str) -> _Timer:
+        """Context manager that observes the time spent inside it."""
+        return _Timer(self, labels)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for key, state in self._values.items():
+            cumulative, buckets = 0.0, {}
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            result[_format_key(key)] = {"count": state[-2], "sum": state[-1], "buckets": buckets}
+        return result
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), state):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-2])}")
+        return lines
+
+
+class Gauge:
+    def __init__(
+        self, name: str, description: str, labels: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]]
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.collect = collect
+
+    def snapshot(self) -> Dict[str, float]:
+        return {_format_key(key): value for key, value in self.collect().items()}
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in self.collect().items()]
+
+
+Metric = Union[Counter, Histogram, Gauge]
+_registry: List[Metric] = []
+
+
+def counter(name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, description, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(
+    name: str, description: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+) -> Histogram:
+    metric = Histogram(name, description, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(
+    name: str, description: str, labels: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]]
+) -> Gauge:
+    """Register a gauge whose values are read from `collect` at snapshot time."""
+    metric = Gauge(name, description, labels, collect)
+    _registry.append(metric)
+    return metric
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+_PROMETHEUS_TYPES = {Counter: "counter", Histogram: "histogram", Gauge: "gauge"}
+
+
+def render_prometheus() -> str:
+    """The registry in the Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {_PROMETHEUS_TYPES[type(metric)]}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,31 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, List, Optional, Tuple, TypeVar
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import counter, histogram
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+T = TypeVar("T")
+
+password_queue_seconds = histogram(
+    "password_hash_queue_seconds", "Time password work waited for a hashing thread", labels=("op",)
+)
+password_work_seconds = histogram("password_hash_seconds", "bcrypt time per password operation", labels=("op",))
+password_rejected_total = counter(
+    "password_hash_rejected_total", "Password operations refused because the hashing queue was full", labels=("op",)
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool already has a full queue."""
+
 
 def hash_password(password: str) -> str:
     # bcrypt only supports up to 72 bytes; schema already enforces this.
@@ -18,6 +36,66 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.password_hash_workers, thread_name_prefix="password-hash"
+        )
+    return _executor
+
+
+async def _run_password_work(op: str, fn: Callable[..., T], *args: str) -> T:
+    """
+    Run bcrypt on the dedicated pool (bcrypt releases the GIL, so threads run in parallel).
+    Requests beyond the workers plus `password_hash_max_queue` are refused instead of queued.
+    """
+    global _pending
+    if _pending >= settings.password_hash_workers + settings.password_hash_max_queue:
+        password_rejected_total.inc(op=op)
+        raise PasswordHasherBusy()
+    submitted = time.perf_counter()
+    timings: List[Tuple[float, float]] = []
+
+    # The worker only records timestamps: metrics are observed back on the event loop, which
+    # /metrics renders from without locking.
+    def timed() -> T:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings.append((started, time.perf_counter()))
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), timed)
+    finally:
+        _pending -= 1
+        if timings:
+            started, finished = timings[0]
+            password_queue_seconds.observe(started - submitted, op=op)
+            password_work_seconds.observe(finished - started, op=op)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_work("hash", hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_work("verify", verify_password, plain_password, hashed_password)
+
+
+def shutdown_password_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
 def create_token(subject: str, expires_minutes: int) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
     to_encode = {"sub": subject, "exp": expire}
@@ -30,3 +108,15 @@ def decode_token(token: str) -> Optional[str]:
         return str(payload.get("sub"))
     except JWTError:
         return None
+
+
+def decode_token_claims(token: str) -> Optional[Tuple[str, float]]:
+    """Return (subject, exp as a unix timestamp) for a valid token."""
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    subject, expires_at = payload.get("sub"), payload.get("exp")
+    if subject is None or expires_at is None:
+        return None
+    return str(subject), float(expires_at)
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+
+class TokenCache:
+    """
+    Verified access token -> user id, bounded in size. Entries expire at the token's `exp` or
+    after `max_ttl_seconds`, whichever comes first, and can be dropped per user.
+    """
+
+    def __init__(self, max_entries: int, max_ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.max_ttl_seconds = max_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[int]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, user_id = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            return None
+        self._entries.move_to_end(token)
+        return user_id
+
+    def set(self, token: str, user_id: int, token_expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = min(token_expires_at, time.time() + self.max_ttl_seconds)
+        self._remove(token)
+        self._entries[token] = (expires_at, user_id)
+        self._tokens_by_user.setdefault(user_id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1]]
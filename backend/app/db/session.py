@@ -1,8 +1,42 @@
-from typing import Optional
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
 
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
+from app.core.metrics import gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+pool_wait_seconds = histogram("db_pool_wait_seconds", "Time spent obtaining a database connection from the pool")
+query_seconds = histogram("db_query_seconds", "Database statement latency by statement type", labels=("op",))
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # Times every checkout, including waits for a free connection and opening new ones.
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        op = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        query_seconds.observe(time.perf_counter() - started, op=op)
+
 
 _engine: Optional[AsyncEngine] = None
 _session_maker: Optional[async_sessionmaker[AsyncSession]] = None
@@ -11,7 +45,17 @@ _session_maker: Optional[async_sessionmaker[AsyncSession]] = None
 def get_engine() -> AsyncEngine:
     global _engine
     if _engine is None:
-        _engine = create_async_engine(settings.database_url, pool_pre_ping=True)
+        _engine = create_async_engine(
+            settings.database_url,
+            poolclass=InstrumentedPool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+        event.listen(_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
     return _engine
 
 
@@ -26,3 +70,40 @@ async def get_session() -> AsyncSession:
     sessionmaker = get_sessionmaker()
     async with sessionmaker() as session:
         yield session
+
+
+def _collect_pool_stats() -> Dict[Tuple[str, ...], float]:
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    return {
+        ("checked_out",): pool.checkedout(),
+        ("idle",): pool.checkedin(),
+        ("overflow",): max(pool.overflow(), 0),
+        ("size",): pool.size(),
+    }
+
+
+gauge("db_pool_connections", "Database pool connections by state", ("state",), _collect_pool_stats)
+
+
+async def _open_connection() -> None:
+    async with get_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def warm_engine() -> None:
+    """Open the first connections at startup, so early requests skip the connect handshake."""
+    connections = min(settings.db_pool_warm_connections, settings.db_pool_size)
+    try:
+        # Concurrent checkouts each get their own connection, which then stays in the pool.
+        await asyncio.gather(*(_open_connection() for _ in range(connections)))
+    except (OSError, SQLAlchemyError):
+        logger.warning("Could not pre-connect to the database")
+
+
+async def dispose_engine() -> None:
+    global _engine, _session_maker
+    if _engine is not None:
+        engine, _engine, _session_maker = _engine, None, None
+        await engine.dispose()
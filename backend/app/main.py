@@ -1,10 +1,42 @@
-from fastapi import FastAPI
+import asyncio
+import math
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import TimeoutError as DBPoolTimeout
 
+from app.api.middleware import RouteTimingMiddleware
 from app.api.router import api_router
 from app.core.config import settings
+from app.core.security import shutdown_password_executor
+from app.db.session import dispose_engine, warm_engine
+from app.services.alpaca_client import close_http_clients, warm_http_clients
+from app.services.prewarm import prewarmer
+from app.services.quote_hub import quote_hub
+from app.services.rate_limit import UpstreamThrottled
+from app.services.redis_client import close_redis
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.gather(warm_http_clients(), warm_engine())
+    # Always started so request counts get flushed; it only warms caches when enabled here.
+    prewarmer.start(warm=settings.prewarm_enabled)
+    try:
+        yield
+    finally:
+        await prewarmer.stop()
+        await quote_hub.stop()
+        await close_http_clients()
+        await close_redis()
+        shutdown_password_executor()
+        await dispose_engine()
 
-app = FastAPI(title="TradeLab API")
+
+app = FastAPI(title="TradeLab API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,6 +45,36 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RouteTimingMiddleware)
+
+
+@app.exception_handler(UpstreamThrottled)
+async def upstream_throttled(request: Request, exc: UpstreamThrottled) -> ORJSONResponse:
+    return ORJSONResponse(
+        {"detail": "Market data is rate limited, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+# UpstreamThrottled is itself a TransportError; handlers are matched on the most specific class.
+@app.exception_handler(httpx.TransportError)
+async def upstream_unavailable(request: Request, exc: httpx.TransportError) -> ORJSONResponse:
+    # Pool timeouts under a burst, timeouts and dropped connections: transient, so not a 500.
+    return ORJSONResponse(
+        {"detail": "Market data is temporarily unavailable, please retry"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(DBPoolTimeout)
+async def database_busy(request: Request, exc: DBPoolTimeout) -> ORJSONResponse:
+    return ORJSONResponse(
+        {"detail": "Service is busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.get("/")
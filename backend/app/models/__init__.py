@@ -1,4 +1,5 @@
+from app.models.bar import Bar, BarSeries
 from app.models.user import User
 from app.models.watchlist import WatchlistItem
 
-__all__ = ["User", "WatchlistItem"]
+__all__ = ["Bar", "BarSeries", "User", "WatchlistItem"]
@@ -0,0 +1,25 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, String
+
+from app.db.base import Base
+
+
+class Bar(Base):
+    __tablename__ = "bars"
+
+    symbol = Column(String(16), primary_key=True)
+    timeframe = Column(String(8), primary_key=True)
+    t = Column(DateTime(timezone=True), primary_key=True)
+    o = Column(Float, nullable=False)
+    h = Column(Float, nullable=False)
+    l = Column(Float, nullable=False)
+    c = Column(Float, nullable=False)
+    v = Column(BigInteger, nullable=False, default=0)
+
+
+class BarSeries(Base):
+    __tablename__ = "bar_series"
+
+    symbol = Column(String(16), primary_key=True)
+    timeframe = Column(String(8), primary_key=True)
+    covered_from = Column(DateTime(timezone=True), nullable=False)
+    synced_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 
 from app.db.base import Base
@@ -14,3 +14,12 @@ class WatchlistItem(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user = relationship("User", backref="watchlist_items")
+
+
+# Serves "symbols for a user, newest first" as an index-only scan with no sort step.
+Index(
+    "ix_watchlist_user_created",
+    WatchlistItem.user_id,
+    WatchlistItem.created_at.desc(),
+    postgresql_include=["symbol"],
+)
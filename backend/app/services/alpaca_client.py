@@ -1,10 +1,20 @@
-from functools import lru_cache
-from typing import Any, Dict, Iterable, List
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Tuple
 
 import httpx
 
 from app.core.config import settings
+from app.core.metrics import gauge, histogram
+from app.services.rate_limit import acquire_upstream, parse_retry_after, pause_upstream
 
+logger = logging.getLogger(__name__)
+
+
+BARS_PAGE_LIMIT = 10000
+# Keeps the symbols query parameter, and so the request line, well under common URL limits.
+BULK_SYMBOLS_MAX_CHARS = 2000
 
 HEADERS = {
     "APCA-API-KEY-ID": settings.alpaca_key_id,
@@ -12,36 +22,263 @@ HEADERS = {
 }
 
 
-@lru_cache(maxsize=1)
-def get_http_client() -> httpx.AsyncClient:
-    return httpx.AsyncClient(timeout=10.0, headers=HEADERS)
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self.in_flight = 0
+        self._transport = httpx.AsyncHTTPTransport(
+            http2=settings.alpaca_http2,
+            limits=httpx.Limits(
+                max_connections=settings.alpaca_http_max_connections,
+                max_keepalive_connections=settings.alpaca_http_max_keepalive,
+                keepalive_expiry=settings.alpaca_http_keepalive_expiry,
+            ),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await acquire_upstream()
+        started = time.perf_counter()
+        waited: List[float] = []
+        parent_trace = request.extensions.get("trace")
+
+        # httpcore reports connection events once the pool hands the request a connection, so
+        # the first event marks the end of the pool wait.
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if not waited:
+                waited.append(time.perf_counter() - started)
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.in_flight += 1
+        status = "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            if response.status_code == 429:
+                await pause_upstream(parse_retry_after(response))
+            return response
+        finally:
+            self.in_flight -= 1
+            http_pool_wait_seconds.observe(waited[0] if waited else time.perf_counter() - started, host=self.host)
+            http_request_seconds.observe(time.perf_counter() - started, host=self.host, status=status)
+
+    async def preconnect(self, url: str) -> None:
+        """Open a pooled connection with a HEAD request that bypasses the limiter and metrics."""
+        response = await self._transport.handle_async_request(httpx.Request("HEAD", url, headers=HEADERS))
+        # Reading the (empty) body to the end is what returns the connection to the pool.
+        await response.aread()
+
+    def pool_stats(self) -> Dict[str, int]:
+        connections = getattr(getattr(self._transport, "_pool", None), "connections", [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"in_flight": self.in_flight, "open": len(connections), "idle": idle}
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+http_request_seconds = histogram(
+    "alpaca_http_request_seconds", "Alpaca request latency including pool wait", labels=("host", "status")
+)
+fetch_seconds = histogram(
+    "alpaca_fetch_seconds", "Alpaca fetches end to end, including paging and JSON decoding", labels=("op",)
+)
+http_pool_wait_seconds = histogram(
+    "alpaca_http_pool_wait_seconds", "Time Alpaca requests waited for a pooled connection", labels=("host",)
+)
+
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_transports: Dict[str, _InstrumentedTransport] = {}
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    """One pooled client per Alpaca base URL, so market data and trading traffic never queue behind each other."""
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        transport = _transports[base_url] = _InstrumentedTransport(httpx.URL(base_url).host)
+        client = _clients[base_url] = httpx.AsyncClient(
+            base_url=base_url,
+            headers=HEADERS,
+            transport=transport,
+            timeout=httpx.Timeout(settings.alpaca_http_timeout, pool=settings.alpaca_http_pool_timeout),
+        )
+    return client
+
+
+def _collect_pool_stats() -> Dict[Tuple[str, ...], float]:
+    return {
+        (transport.host, state): count
+        for transport in _transports.values()
+        for state, count in transport.pool_stats().items()
+    }
+
+
+gauge("alpaca_http_connections", "Alpaca pool connections by state", ("host", "state"), _collect_pool_stats)
+
+
+async def _warm(base_url: str) -> None:
+    # Not worth a rate limit token, and never fatal: requests connect on demand anyway.
+    get_http_client(base_url)
+    try:
+        await _transports[base_url].preconnect(base_url)
+    except Exception:
+        logger.warning("Could not pre-connect to %s", base_url, exc_info=True)
+
+
+async def warm_http_clients() -> None:
+    await asyncio.gather(*(_warm(base_url) for base_url in {settings.alpaca_data_base, settings.alpaca_trade_base}))
+
+
+async def close_http_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    _transports.clear()
+    for client in clients:
+        await client.aclose()
 
 
 async def fetch_assets() -> List[Dict[str, Any]]:
-    client = get_http_client()
-    url = f"{settings.alpaca_trade_base}/v2/assets"
+    client = get_http_client(settings.alpaca_trade_base)
+    url = "/v2/assets"
     params = {"status": "active", "asset_class": "us_equity"}
-    resp = await client.get(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    with fetch_seconds.timer(op="assets"):
+        resp = await client.get(url, params=params)
+        resp.raise_for_status()
+        return resp.json()
 
 
 async def fetch_latest_quotes(symbols: Iterable[str]) -> Dict[str, Any]:
-    client = get_http_client()
-    symbols_str = ",".join(symbols)
-    url = f"{settings.alpaca_data_base}/v2/stocks/quotes/latest"
-    params = {"symbols": symbols_str, "feed": "delayed_sip"}
-    resp = await client.get(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
-
-
-async def fetch_bars(symbol: str, timeframe: str = "1Hour", limit: int = 24, start: str | None = None) -> Dict[str, Any]:
-    client = get_http_client()
-    url = f"{settings.alpaca_data_base}/v2/stocks/{symbol}/bars"
-    params = {"timeframe": timeframe, "limit": limit, "feed": "delayed_sip", "sort": "asc"}
-    if start:
-        params["start"] = start
-    resp = await client.get(url, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    """{"quotes": {symbol: quote}}, fetched in URL-sized chunks concurrently."""
+    client = get_http_client(settings.alpaca_data_base)
+
+    async def fetch_chunk(chunk: List[str]) -> Dict[str, Any]:
+        params = {"symbols": ",".join(chunk), "feed": "delayed_sip"}
+        with fetch_seconds.timer(op="latest_quotes"):
+            resp = await client.get("/v2/stocks/quotes/latest", params=params)
+            resp.raise_for_status()
+            return resp.json()
+
+    chunks = _chunk_symbols(dict.fromkeys(symbols), BULK_SYMBOLS_MAX_CHARS)
+    quotes: Dict[str, Any] = {}
+    for page in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        quotes.update(page.get("quotes") or {})
+    return {"quotes": quotes}
+
+
+async def fetch_snapshots(symbols: Iterable[str]) -> Dict[str, Any]:
+    """Snapshots (latest quote and trade, daily and previous daily bar) keyed by symbol."""
+    client = get_http_client(settings.alpaca_data_base)
+
+    async def fetch_chunk(chunk: List[str]) -> Dict[str, Any]:
+        params = {"symbols": ",".join(chunk), "feed": "delayed_sip"}
+        with fetch_seconds.timer(op="snapshots"):
+            resp = await client.get("/v2/stocks/snapshots", params=params)
+            resp.raise_for_status()
+            return resp.json()
+
+    chunks = _chunk_symbols(dict.fromkeys(symbols), BULK_SYMBOLS_MAX_CHARS)
+    snapshots: Dict[str, Any] = {}
+    for page in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        snapshots.update(page)
+    return snapshots
+
+
+def _chunk_symbols(symbols: Iterable[str], max_chars: int) -> List[List[str]]:
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    length = 0
+    for symbol in symbols:
+        if current and length + len(symbol) + 1 > max_chars:
+            chunks.append(current)
+            current, length = [], 0
+        current.append(symbol)
+        length += len(symbol) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _iter_bar_pages(
+    symbols: List[str], timeframe: str, start: str, end: str | None
+) -> AsyncIterator[Dict[str, List[Dict[str, Any]]]]:
+    client = get_http_client(settings.alpaca_data_base)
+    url = "/v2/stocks/bars"
+    params: Dict[str, Any] = {
+        "symbols": ",".join(symbols),
+        "timeframe": timeframe,
+        "start": start,
+        "limit": BARS_PAGE_LIMIT,
+        "feed": "delayed_sip",
+        "sort": "asc",
+    }
+    if end:
+        params["end"] = end
+    while True:
+        # Timed per page: the generator is suspended while the consumer handles each page.
+        with fetch_seconds.timer(op="bars_bulk_page"):
+            resp = await client.get(url, params=params)
+            resp.raise_for_status()
+            data = resp.json()
+        yield data.get("bars") or {}
+        page_token = data.get("next_page_token")
+        if not page_token:
+            return
+        params["page_token"] = page_token
+
+
+async def iter_bar_pages(
+    symbol: str, timeframe: str, start: str, end: str | None = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield one symbol's bars a page at a time, so callers never hold the whole range."""
+    async for page in _iter_bar_pages([symbol], timeframe, start, end):
+        yield page.get(symbol) or []
+
+
+async def iter_bars(
+    symbols: Iterable[str],
+    timeframe: str,
+    start: str,
+    end: str | None = None,
+    max_concurrency: int | None = None,
+) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Stream (symbol, bars) batches from the multi-symbol bars endpoint as pages arrive. Symbols
+    are split into URL-sized chunks that are paged through concurrently, at most
+    `max_concurrency` at a time. A symbol may appear in several batches when it spans pages.
+    """
+    chunks = _chunk_symbols(dict.fromkeys(symbols), BULK_SYMBOLS_MAX_CHARS)
+    if not chunks:
+        return
+    concurrency = max_concurrency or settings.alpaca_bulk_max_concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    finished = object()
+
+    async def produce(chunk: List[str]) -> None:
+        try:
+            async with semaphore:
+                async for page in _iter_bar_pages(chunk, timeframe, start, end):
+                    for symbol, bars in page.items():
+                        await queue.put((symbol, bars))
+        except Exception as exc:
+            await queue.put(exc)
+        else:
+            await queue.put(finished)
+
+    producers = [asyncio.create_task(produce(chunk)) for chunk in chunks]
+    remaining = len(producers)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for producer in producers:
+            producer.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
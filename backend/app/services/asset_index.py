@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.services import singleflight
+from app.services.alpaca_client import fetch_assets
+from app.services.redis_client import get_json, get_redis_client, set_json
+
+ASSETS_CACHE_KEY = "alpaca:assets:us_equity_active"
+ASSETS_TTL_SECONDS = 6 * 60 * 60
+# After a failed rebuild the previous index is served for this long before trying again.
+REBUILD_RETRY_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+# Symbols are short, so every 1-3 character substring is indexed and any query up to
+# three characters is a single dict lookup. Names only get trigrams to bound memory.
+SYMBOL_GRAM_SIZES = (1, 2, 3)
+NAME_GRAM_SIZES = (3,)
+
+
+def _build_grams(texts: Sequence[str], sizes: Tuple[int, ...]) -> Dict[str, List[int]]:
+    postings: Dict[str, List[int]] = {}
+    for doc_id, text in enumerate(texts):
+        grams = {text[i : i + n] for n in sizes for i in range(len(text) - n + 1)}
+        for gram in grams:
+            postings.setdefault(gram, []).append(doc_id)
+    return postings
+
+
+def _contains(postings: Dict[str, List[int]], texts: Sequence[str], query: str, gram_size: int) -> Sequence[int]:
+    if len(query) <= gram_size:
+        return postings.get(query, ())
+    grams = {query[i : i + gram_size] for i in range(len(query) - gram_size + 1)}
+    lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+    if not lists[0]:
+        return ()
+    candidates = set(lists[0])
+    for ids in lists[1:]:
+        candidates.intersection_update(ids)
+        if not candidates:
+            return ()
+    return [doc_id for doc_id in sorted(candidates) if query in texts[doc_id]]
+
+
+class AssetIndex:
+    def __init__(self, assets: Iterable[Dict[str, Any]]) -> None:
+        names_by_symbol: Dict[str, str] = {}
+        for asset in assets:
+            symbol = (asset.get("symbol") or "").upper()
+            if symbol and symbol not in names_by_symbol:
+                names_by_symbol[symbol] = asset.get("name") or ""
+        self.symbols: List[str] = sorted(names_by_symbol)
+        self.names: List[str] = [names_by_symbol[symbol] for symbol in self.symbols]
+        self._names_upper = [name.upper() for name in self.names]
+        self._symbol_grams = _build_grams(self.symbols, SYMBOL_GRAM_SIZES)
+        self._name_grams = _build_grams(self._names_upper, NAME_GRAM_SIZES)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def _prefix(self, query: str) -> Iterator[int]:
+        symbols = self.symbols
+        doc_id = bisect_left(symbols, query)
+        while doc_id < len(symbols) and symbols[doc_id].startswith(query):
+            yield doc_id
+            doc_id += 1
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+        query = query.strip().upper()
+        if not query or limit <= 0:
+            return []
+
+        hits: List[int] = []
+        seen = set()
+        matches = (
+            self._prefix(query),
+            _contains(self._symbol_grams, self.symbols, query, max(SYMBOL_GRAM_SIZES)),
+            _contains(self._name_grams, self._names_upper, query, max(NAME_GRAM_SIZES)),
+        )
+        for doc_ids in matches:
+            for doc_id in doc_ids:
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                hits.append(doc_id)
+                if len(hits) >= limit:
+                    break
+            if len(hits) >= limit:
+                break
+        return [{"symbol": self.symbols[doc_id], "name": self.names[doc_id]} for doc_id in hits]
+
+
+_index: Optional[AssetIndex] = None
+_index_expires_at = 0.0
+_index_lock = asyncio.Lock()
+
+
+async def refresh_assets() -> List[Dict[str, Any]]:
+    assets = await fetch_assets()
+    await set_json(ASSETS_CACHE_KEY, assets, ttl_seconds=ASSETS_TTL_SECONDS)
+    return assets
+
+
+async def _load_assets() -> Tuple[List[Dict[str, Any]], int]:
+    assets = await get_json(ASSETS_CACHE_KEY)
+    if assets is None:
+        assets = await singleflight.do(
+            ASSETS_CACHE_KEY, refresh_assets, cached=lambda: get_json(ASSETS_CACHE_KEY)
+        )
+        return assets, ASSETS_TTL_SECONDS
+    ttl = await get_redis_client().ttl(ASSETS_CACHE_KEY)
+    return assets, ttl if ttl > 0 else ASSETS_TTL_SECONDS
+
+
+async def get_asset_index() -> AssetIndex:
+    """
+    Return the per-process search index, rebuilding it when the cached asset list expires.
+    Requests arriving while a rebuild is in flight keep using the previous index, as do all
+    requests for REBUILD_RETRY_SECONDS after a rebuild fails.
+    """
+    global _index, _index_expires_at
+    index = _index
+    if index is not None and (time.monotonic() < _index_expires_at or _index_lock.locked()):
+        return index
+
+    async with _index_lock:
+        if _index is not None and time.monotonic() < _index_expires_at:
+            return _index
+        try:
+            assets, ttl = await _load_assets()
+            rebuilt = await asyncio.to_thread(AssetIndex, assets)
+        except Exception as exc:
+            if _index is None:
+                raise
+            logger.warning("Rebuilding the asset index failed, serving the previous one: %r", exc)
+            _index_expires_at = time.monotonic() + REBUILD_RETRY_SECONDS
+            return _index
+        _index, _index_expires_at = rebuilt, time.monotonic() + ttl
+        return rebuilt
@@ -0,0 +1,134 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_sessionmaker
+from app.models import Bar, BarSeries
+from app.services.alpaca_client import iter_bar_pages
+
+# The timeframes Alpaca serves; each group is named after its unit in TIMEFRAME_UNITS.
+TIMEFRAME_RE = re.compile(
+    r"(?P<Min>[1-9]|[1-5][0-9])Min|(?P<Hour>[1-9]|1[0-9]|2[0-3])Hour|(?P<Day>1)Day|(?P<Week>1)Week"
+    r"|(?P<Month>[1-46]|12)Month"
+)
+TIMEFRAME_UNITS = {
+    "Min": timedelta(minutes=1),
+    "Hour": timedelta(hours=1),
+    "Day": timedelta(days=1),
+    "Week": timedelta(weeks=1),
+    "Month": timedelta(days=30),
+}
+SYNC_INTERVAL = timedelta(seconds=60)
+# asyncpg caps a statement at 32767 bind parameters; a bar row uses eight.
+INSERT_CHUNK_SIZE = 2000
+
+
+def parse_timeframe(timeframe: str) -> timedelta:
+    match = TIMEFRAME_RE.fullmatch(timeframe)
+    if not match:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    return int(match.group(match.lastgroup)) * TIMEFRAME_UNITS[match.lastgroup]
+
+
+def format_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _bar_row(symbol: str, timeframe: str, bar: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    t, c = bar.get("t"), bar.get("c")
+    if t is None or c is None:
+        return None
+    return {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "t": datetime.fromisoformat(t.replace("Z", "+00:00")),
+        "o": bar.get("o", c),
+        "h": bar.get("h", c),
+        "l": bar.get("l", c),
+        "c": c,
+        "v": bar.get("v") or 0,
+    }
+
+
+async def _upsert_bars(session: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    for offset in range(0, len(rows), INSERT_CHUNK_SIZE):
+        stmt = pg_insert(Bar).values(rows[offset : offset + INSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Bar.symbol, Bar.timeframe, Bar.t],
+            set_={column: stmt.excluded[column] for column in ("o", "h", "l", "c", "v")},
+        )
+        await session.execute(stmt)
+
+
+async def _store_range(
+    session: AsyncSession, symbol: str, timeframe: str, start: datetime, end: Optional[datetime]
+) -> None:
+    # Each page is upserted in its own short transaction as it arrives, so neither the rows nor
+    # a connection are held across the whole range.
+    async for bars in iter_bar_pages(symbol, timeframe, format_time(start), format_time(end) if end else None):
+        rows = [row for row in (_bar_row(symbol, timeframe, bar) for bar in bars) if row is not None]
+        if rows:
+            await _upsert_bars(session, rows)
+            await session.commit()
+
+
+async def _sync(session: AsyncSession, symbol: str, timeframe: str, start: datetime) -> None:
+    series = await session.get(BarSeries, (symbol, timeframe))
+    now = datetime.now(timezone.utc)
+    backfill = series is None or start < series.covered_from
+    tail = series is not None and now - series.synced_at >= SYNC_INTERVAL
+    if not backfill and not tail:
+        return
+    covered_from = series.covered_from if series else None
+    last_t = None
+    if tail:
+        last_t = await session.scalar(
+            select(func.max(Bar.t)).where(Bar.symbol == symbol, Bar.timeframe == timeframe)
+        )
+    # Ends the read transaction, returning the connection to the pool while Alpaca is paged
+    # through (which can include rate limiter waits).
+    await session.commit()
+
+    # Start the tail at the newest stored bar rather than after it: it may have been partial
+    # when stored. A series last synced before `start` restarts its coverage at `start` rather
+    # than filling the whole gap, which would be unbounded.
+    restart = tail and start > (last_t or covered_from)
+    if backfill:
+        await _store_range(session, symbol, timeframe, start, covered_from)
+    if tail:
+        await _store_range(session, symbol, timeframe, start if restart else last_t or covered_from, None)
+
+    synced_at = now if series is None or tail else series.synced_at
+    covered = start if restart else func.least(BarSeries.covered_from, start)
+    stmt = pg_insert(BarSeries).values(symbol=symbol, timeframe=timeframe, covered_from=start, synced_at=synced_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BarSeries.symbol, BarSeries.timeframe],
+        set_={"covered_from": covered, "synced_at": synced_at},
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def load_closes(
+    symbol: str, timeframe: str, start: datetime, end: Optional[datetime] = None, limit: Optional[int] = None
+) -> List[Tuple[datetime, float]]:
+    """
+    Return stored (t, close) pairs for [start, end], syncing from Alpaca first. Only the missing
+    history and bars newer than the last stored one are fetched. With `limit`, the most recent
+    bars are kept.
+    """
+    parse_timeframe(timeframe)
+    async with get_sessionmaker()() as session:
+        await _sync(session, symbol, timeframe, start)
+        query = select(Bar.t, Bar.c).where(Bar.symbol == symbol, Bar.timeframe == timeframe, Bar.t >= start)
+        if end is not None:
+            query = query.where(Bar.t <= end)
+        if limit is not None:
+            rows = [tuple(row) for row in await session.execute(query.order_by(Bar.t.desc()).limit(limit))]
+            rows.reverse()
+            return rows
+        return [tuple(row) for row in await session.execute(query.order_by(Bar.t))]
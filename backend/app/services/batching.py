@@ -0,0 +1,81 @@
+"""
+Coalesces concurrent cache misses into one batched fetch.
+
+A burst of requests for different symbol sets (a deploy, a cache flush, many clients opening
+their watchlists at once) would otherwise make one upstream call per request; singleflight only
+merges callers asking for exactly the same key. A KeyBatcher collects the keys every caller is
+missing over a short window and fetches their union once, chunked by the Alpaca client.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.metrics import counter
+from app.services.rate_limit import BACKGROUND, INTERACTIVE, upstream_priority
+
+batched_callers = counter("batch_callers_total", "Callers served by a batched fetch", labels=("batch",))
+batched_fetches = counter("batch_fetches_total", "Batched fetches run", labels=("batch",))
+batch_retries = counter(
+    "batch_retries_total", "Callers that refetched their own keys after a batched fetch failed", labels=("batch",)
+)
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.keys: Dict[str, None] = {}
+        self.callers = 0
+        self.interactive = False
+        self.result: "asyncio.Future[Dict[str, bytes]]" = asyncio.get_running_loop().create_future()
+
+
+class KeyBatcher:
+    def __init__(
+        self, name: str, fetch: Callable[[List[str]], Awaitable[Dict[str, bytes]]], window_seconds: float
+    ) -> None:
+        self.name = name
+        self.window_seconds = window_seconds
+        self._fetch = fetch
+        self._batch: Optional[_Batch] = None
+        self._flushes: Set["asyncio.Task[None]"] = set()
+
+    async def load(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Values for `keys`, fetched together with those of callers arriving within the window. If
+        the shared fetch fails, each caller fetches its own keys, so one caller's bad key only
+        fails that caller.
+        """
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _Batch()
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        batch.keys.update(dict.fromkeys(keys))
+        batch.callers += 1
+        batch.interactive |= upstream_priority.get() == INTERACTIVE
+        batched_callers.inc(batch=self.name)
+        try:
+            # Shielded: a caller going away must not cancel the fetch the others are waiting on.
+            values = await asyncio.shield(batch.result)
+        except Exception:
+            if batch.callers == 1:
+                raise
+            batch_retries.inc(batch=self.name)
+            values = await self._fetch(keys)
+        return {key: values[key] for key in keys if key in values}
+
+    async def _flush(self, batch: _Batch) -> None:
+        await asyncio.sleep(self.window_seconds)
+        self._batch = None
+        # The task inherited its priority from whichever caller came first; a batch with any
+        # user-facing caller is fetched as interactive.
+        upstream_priority.set(INTERACTIVE if batch.interactive else BACKGROUND)
+        batched_fetches.inc(batch=self.name)
+        try:
+            batch.result.set_result(await self._fetch(sorted(batch.keys)))
+        except asyncio.CancelledError:
+            batch.result.cancel()
+            raise
+        except Exception as exc:
+            batch.result.set_exception(exc)
+            # Retrieved here so a batch whose callers all went away is not reported as unhandled.
+            batch.result.exception()
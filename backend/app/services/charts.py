@@ -0,0 +1,201 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from app.services import singleflight, swr
+from app.services.alpaca_client import iter_bars
+from app.services.batching import KeyBatcher
+from app.services.bar_store import format_time, load_closes, parse_timeframe
+from app.services.downsample import lttb_indices
+from app.services.symbols import check_symbols
+
+# Wide enough to span a weekend plus a holiday when the requested bars are intraday.
+CHART_MIN_LOOKBACK = timedelta(days=4)
+CHART_DEFAULT_TIMEFRAME = "1Hour"
+CHART_DEFAULT_LIMIT = 24
+CHART_DEFAULT_MAX_POINTS = 500
+CHART_TTL_SECONDS = 60
+# How long past CHART_TTL_SECONDS a chart may still be served while it is being refreshed.
+CHART_STALE_SECONDS = 60 * 60
+SPARKLINE_PREFIX = "sparkline:1Hour:24:delayed_sip:"
+SPARKLINE_TIMEFRAME = "1Hour"
+SPARKLINE_POINTS = 24
+# Misses from concurrent requests arriving this close together are fetched in one bulk request.
+SPARKLINE_BATCH_WINDOW_SECONDS = 0.01
+# Most bars one chart may span, counted in trading time: enough for a year of minute bars, while
+# years of them cannot be paged through (and stored) for one chart.
+CHART_MAX_BARS = 250_000
+# Bars trade on about 252 sessions a year, each with 16 hours of bars (4:00-20:00 ET, including
+# extended hours); weekly and monthly bars are counted in calendar time.
+TRADING_DAYS_PER_YEAR = 252
+TRADING_SESSION = timedelta(hours=16)
+# Farthest back a chart may reach; a coarse timeframe with a large limit is clamped to it.
+CHART_MAX_LOOKBACK = timedelta(days=20 * 366)
+CHART_RANGES: Dict[str, Tuple[timedelta, str]] = {
+    "1D": (timedelta(days=1), "5Min"),
+    "5D": (timedelta(days=5), "15Min"),
+    "1M": (timedelta(days=31), "1Hour"),
+    "3M": (timedelta(days=92), "1Hour"),
+    "6M": (timedelta(days=183), "1Day"),
+    "1Y": (timedelta(days=366), "1Day"),
+    "5Y": (timedelta(days=5 * 366), "1Week"),
+}
+
+
+class ChartSpec:
+    """
+    A validated chart request; raises ValueError for a malformed symbol, an unknown range or
+    timeframe, or one spanning more than CHART_MAX_BARS trading bars.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        range_: Optional[str] = None,
+        timeframe: Optional[str] = None,
+        limit: int = CHART_DEFAULT_LIMIT,
+        max_points: int = CHART_DEFAULT_MAX_POINTS,
+    ) -> None:
+        # Before anything reaches the bar store: every symbol charted gets a bar_series row.
+        check_symbols([symbol])
+        self.symbol = symbol
+        self.limit = limit
+        self.max_points = max_points
+        self.span: Optional[timedelta] = None
+        if range_ is not None:
+            if range_ not in CHART_RANGES:
+                raise ValueError(f"Unsupported range: {range_}")
+            self.span, default_timeframe = CHART_RANGES[range_]
+            self.timeframe = timeframe or default_timeframe
+            self.cache_key = f"chart:{range_}:{self.timeframe}:{max_points}:delayed_sip:{symbol}"
+        else:
+            self.timeframe = timeframe or CHART_DEFAULT_TIMEFRAME
+            self.cache_key = f"chart:{self.timeframe}:{limit}:{max_points}:delayed_sip:{symbol}"
+        self.duration = parse_timeframe(self.timeframe)
+        if self.span is not None:
+            self.lookback = max(self.span, CHART_MIN_LOOKBACK)
+        else:
+            self.lookback = min(max(CHART_MIN_LOOKBACK, self.duration * limit * 2), CHART_MAX_LOOKBACK)
+        if _trading_bars(self.lookback, self.duration) > CHART_MAX_BARS:
+            raise ValueError(f"Timeframe {self.timeframe} is too fine for this range (over {CHART_MAX_BARS} bars)")
+
+
+def _trading_bars(span: timedelta, duration: timedelta) -> float:
+    """Roughly how many bars of `duration` trade within `span`."""
+    if duration > timedelta(days=1):
+        return span / duration
+    sessions = span / timedelta(days=365) * TRADING_DAYS_PER_YEAR
+    return sessions * max(TRADING_SESSION / duration, 1)
+
+
+def _chart_points(rows: List[Tuple[datetime, float]], span: Optional[timedelta], max_points: int) -> List[dict]:
+    if not rows:
+        return []
+    ts = np.fromiter((t.timestamp() for t, _ in rows), dtype=np.float64, count=len(rows))
+    closes = np.fromiter((c for _, c in rows), dtype=np.float64, count=len(rows))
+    first = 0
+    if span is not None:
+        # Anchor the range on the latest bar so "1D" still shows a full session over a weekend.
+        first = int(np.searchsorted(ts, ts[-1] - span.total_seconds()))
+    indices = lttb_indices(ts[first:], closes[first:], max_points) + first
+    return [{"t": format_time(rows[i][0]), "c": rows[i][1]} for i in indices]
+
+
+async def refresh_chart(spec: ChartSpec) -> bytes:
+    """Rebuild the chart from the bar store (syncing new bars upstream) and cache it."""
+    start = datetime.now(timezone.utc) - spec.lookback
+    if spec.span is not None:
+        rows = await load_closes(spec.symbol, spec.timeframe, start)
+    else:
+        rows = await load_closes(spec.symbol, spec.timeframe, start, limit=spec.limit)
+    points = await asyncio.to_thread(_chart_points, rows, spec.span, spec.max_points)
+    body = orjson.dumps({"symbol": spec.symbol, "asOf": datetime.now(timezone.utc).isoformat(), "points": points})
+    await swr.set_entry(spec.cache_key, body, CHART_TTL_SECONDS, CHART_STALE_SECONDS)
+    return body
+
+
+async def load_chart(spec: ChartSpec) -> Tuple[bytes, bool]:
+    """
+    Return the serialized chart and whether it is stale. Stale charts are served as-is and
+    refreshed in the background; only a missing chart waits on the bar store.
+    """
+
+    def fetch() -> Awaitable[bytes]:
+        return refresh_chart(spec)
+
+    cached = await swr.get_entry(spec.cache_key)
+    if cached is not None:
+        body, fresh = cached
+        if not fresh:
+            swr.revalidate(spec.cache_key, fetch, cached=lambda: swr.get_fresh(spec.cache_key))
+        return body, not fresh
+
+    body = await singleflight.do(spec.cache_key, fetch, cached=lambda: swr.get_fresh(spec.cache_key))
+    return body, False
+
+
+def sparkline_cache_key(symbol: str) -> str:
+    return f"{SPARKLINE_PREFIX}{symbol}"
+
+
+async def refresh_sparklines(symbols: List[str]) -> Dict[str, bytes]:
+    """
+    Fetch the last SPARKLINE_POINTS hourly closes for all `symbols` through the multi-symbol bars
+    endpoint (one request per URL-sized chunk and page) and cache each as a JSON array.
+    """
+    closes: Dict[str, List[float]] = {symbol: [] for symbol in symbols}
+    start = format_time(datetime.now(timezone.utc) - CHART_MIN_LOOKBACK)
+    async for symbol, bars in iter_bars(symbols, SPARKLINE_TIMEFRAME, start):
+        if symbol in closes:
+            closes[symbol].extend(bar["c"] for bar in bars)
+    series = {symbol: orjson.dumps(values[-SPARKLINE_POINTS:]) for symbol, values in closes.items()}
+    await swr.mset_entries(
+        {sparkline_cache_key(symbol): body for symbol, body in series.items()}, CHART_TTL_SECONDS, CHART_STALE_SECONDS
+    )
+    return series
+
+
+async def _cached_sparklines(symbols: List[str], fresh_only: bool = False) -> Optional[Dict[str, bytes]]:
+    entries = await swr.mget_entries([sparkline_cache_key(symbol) for symbol in symbols])
+    if any(entry is None or (fresh_only and not entry[1]) for entry in entries):
+        return None
+    return {symbol: entry[0] for symbol, entry in zip(symbols, entries)}
+
+
+def _fetch_missing_sparklines(symbols: List[str]) -> Awaitable[Dict[str, bytes]]:
+    return singleflight.do(
+        f"{SPARKLINE_PREFIX}{','.join(symbols)}",
+        lambda: refresh_sparklines(symbols),
+        cached=lambda: _cached_sparklines(symbols),
+    )
+
+
+_missing_sparklines = KeyBatcher("sparklines", _fetch_missing_sparklines, SPARKLINE_BATCH_WINDOW_SECONDS)
+
+
+async def load_sparklines(symbols: List[str]) -> Tuple[Dict[str, bytes], bool]:
+    """
+    Serialized close series for `symbols` and whether any is stale: one MGET for cached series,
+    one batched upstream fetch for the missing ones (shared with concurrent callers), background
+    refresh for the stale ones. Raises ValueError for a malformed symbol.
+    """
+    unique = list(dict.fromkeys(symbols))
+    check_symbols(unique)
+    entries = await swr.mget_entries([sparkline_cache_key(symbol) for symbol in unique])
+    series = {symbol: entry[0] for symbol, entry in zip(unique, entries) if entry is not None}
+
+    stale = sorted(symbol for symbol, entry in zip(unique, entries) if entry is not None and not entry[1])
+    if stale:
+        swr.revalidate(
+            f"{SPARKLINE_PREFIX}{','.join(stale)}",
+            lambda: refresh_sparklines(stale),
+            cached=lambda: _cached_sparklines(stale, fresh_only=True),
+        )
+
+    missing = sorted(symbol for symbol in unique if symbol not in series)
+    if missing:
+        series.update(await _missing_sparklines.load(missing))
+    return {symbol: series[symbol] for symbol in unique}, bool(stale)
@@ -0,0 +1,101 @@
+"""
+Previous-session closes for computing quote change percentages.
+
+The table is a NumPy array of closes indexed through a symbol -> row dict, so the quote builder
+can look up every requested symbol at once. Rows are loaded on first use in a session from
+Alpaca snapshots (one request per URL-sized chunk of symbols) and shared between workers
+through Redis; the table starts over when the US/Eastern trading date changes.
+"""
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import httpx
+import numpy as np
+
+from app.services.alpaca_client import fetch_snapshots
+from app.services.redis_client import mget_json, mset_json
+
+logger = logging.getLogger(__name__)
+
+PREV_CLOSE_PREFIX = "prev_close:"
+# Long enough to cover the session the closes were loaded for, wherever in it they were loaded.
+PREV_CLOSE_TTL_SECONDS = 36 * 60 * 60
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+
+
+def session_date() -> date:
+    return datetime.now(MARKET_TIMEZONE).date()
+
+
+def _bar_date(bar: Dict[str, Any]) -> date:
+    return datetime.fromisoformat(bar["t"].replace("Z", "+00:00")).astimezone(MARKET_TIMEZONE).date()
+
+
+def _close_before(snapshot: Optional[Dict[str, Any]], session: date) -> Optional[float]:
+    # Once the session has traded, dailyBar is today's and prevDailyBar holds the reference close;
+    # before the open (or on a holiday) dailyBar is itself the last completed session.
+    for name in ("dailyBar", "prevDailyBar"):
+        bar = (snapshot or {}).get(name)
+        if bar and bar.get("t") and bar.get("c") is not None and _bar_date(bar) < session:
+            return float(bar["c"])
+    return None
+
+
+class PrevCloseTable:
+    def __init__(self) -> None:
+        self.session: Optional[date] = None
+        self._index: Dict[str, int] = {}
+        self._closes = np.empty(0, dtype=np.float64)
+
+    def _start_session(self, session: date) -> None:
+        if session != self.session:
+            self.session = session
+            self._index = {}
+            self._closes = np.empty(0, dtype=np.float64)
+
+    async def lookup(self, symbols: List[str]) -> np.ndarray:
+        """Previous closes aligned with `symbols`; NaN where none is known."""
+        session = session_date()
+        self._start_session(session)
+        missing = list(dict.fromkeys(symbol for symbol in symbols if symbol not in self._index))
+        if missing:
+            # Not locked: concurrent lookups of different symbols load in parallel, and one that
+            # overlaps a load in flight costs at most a duplicate fetch.
+            closes = await self._load(missing, session)
+            if session == self.session:
+                self._append({symbol: close for symbol, close in closes.items() if symbol not in self._index})
+        # Symbols whose closes could not be loaded have no row, and no reference price, this time.
+        rows = np.fromiter((self._index.get(symbol, -1) for symbol in symbols), dtype=np.intp, count=len(symbols))
+        found = rows >= 0
+        closes = np.full(len(symbols), np.nan)
+        closes[found] = self._closes[rows[found]]
+        return closes
+
+    def _append(self, closes: Dict[str, Optional[float]]) -> None:
+        start = len(self._closes)
+        self._index.update((symbol, start + offset) for offset, symbol in enumerate(closes))
+        self._closes = np.concatenate([self._closes, np.array(list(closes.values()), dtype=np.float64)])
+
+    async def _load(self, symbols: List[str], session: date) -> Dict[str, Optional[float]]:
+        keys = {symbol: f"{PREV_CLOSE_PREFIX}{session.isoformat()}:{symbol}" for symbol in symbols}
+        cached = await mget_json(list(keys.values()))
+        closes = {symbol: entry["c"] for symbol, entry in zip(symbols, cached) if isinstance(entry, dict)}
+        unknown = [symbol for symbol in symbols if symbol not in closes]
+        if unknown:
+            try:
+                snapshots = await fetch_snapshots(unknown)
+            except httpx.HTTPError as exc:
+                # Quotes still go out, without changePct; the next request for these symbols retries.
+                logger.warning("Loading previous closes failed: %r", exc)
+                return closes
+            fetched = {symbol: _close_before(snapshots.get(symbol), session) for symbol in unknown}
+            await mset_json(
+                {keys[symbol]: {"c": close} for symbol, close in fetched.items()}, PREV_CLOSE_TTL_SECONDS
+            )
+            closes.update(fetched)
+        return closes
+
+
+previous_closes = PrevCloseTable()
@@ -0,0 +1,177 @@
+"""
+Keeps the asset list and the most requested symbols' quotes and default charts warm, so users
+after an expiry or a deploy hit the cache instead of Alpaca.
+
+Every worker counts symbol requests in memory and flushes them into a Redis sorted set each
+cycle. One worker at a time (the holder of a Redis lease) then refreshes entries that would go
+stale before the next cycle, spending at most `prewarm_upstream_budget` upstream refreshes per
+cycle. Run it inside the API (PREWARM_ENABLED=true) or as its own process:
+
+    python -m app.services.prewarm
+"""
+import asyncio
+import logging
+import secrets
+from collections import Counter
+from typing import Awaitable, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import counter
+from app.db.session import dispose_engine
+from app.services import singleflight, swr
+from app.services.alpaca_client import close_http_clients
+from app.services.asset_index import ASSETS_CACHE_KEY, refresh_assets
+from app.services.charts import ChartSpec, refresh_chart
+from app.services.quotes import quote_cache_key, refresh_quotes
+from app.services.rate_limit import background_priority
+from app.services.redis_client import close_redis, get_redis_client, mget_raw, pipeline
+from app.services.symbols import SYMBOL_RE
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_KEY = "popularity:symbols"
+LEADER_KEY = "prewarm:leader"
+# Scores are multiplied by this every cycle, so popularity follows recent demand.
+POPULARITY_DECAY = 0.97
+POPULARITY_MAX_SYMBOLS = 5000
+ASSETS_REFRESH_LEAD_SECONDS = 15 * 60
+
+refreshes = counter("prewarm_refreshes_total", "Entries refreshed ahead of expiry", labels=("kind", "result"))
+
+_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+
+class Prewarmer:
+    def __init__(self, interval_seconds: float, top_symbols: int, upstream_budget: int) -> None:
+        self.interval_seconds = interval_seconds
+        self.top_symbols = top_symbols
+        self.upstream_budget = upstream_budget
+        self._interest: Counter = Counter()
+        self._token = secrets.token_hex(8)
+        self._task: Optional[asyncio.Task] = None
+
+    def record_interest(self, symbols: Iterable[str]) -> None:
+        self._interest.update(symbols)
+
+    def start(self, warm: bool) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(warm))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self, warm: bool) -> None:
+        with background_priority():
+            await self._loop(warm)
+
+    async def _loop(self, warm: bool) -> None:
+        while True:
+            try:
+                await self._flush_interest()
+                if warm and await self._hold_lease():
+                    await self.warm_once()
+            except Exception:
+                logger.exception("Prewarm cycle failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _flush_interest(self) -> None:
+        if not self._interest:
+            return
+        counts, self._interest = self._interest, Counter()
+        async with pipeline() as pipe:
+            for symbol, count in counts.items():
+                pipe.zincrby(POPULARITY_KEY, count, symbol)
+
+    async def _hold_lease(self) -> bool:
+        lease_ms = int(self.interval_seconds * 3 * 1000)
+        return bool(await get_redis_client().eval(_LEASE_SCRIPT, 1, LEADER_KEY, self._token, lease_ms))
+
+    async def _top_symbols(self) -> List[str]:
+        async with get_redis_client().pipeline(transaction=False) as pipe:
+            pipe.zunionstore(POPULARITY_KEY, {POPULARITY_KEY: POPULARITY_DECAY})
+            pipe.zremrangebyrank(POPULARITY_KEY, 0, -POPULARITY_MAX_SYMBOLS - 1)
+            pipe.zrevrange(POPULARITY_KEY, 0, self.top_symbols - 1)
+            *_, top = await pipe.execute()
+        # Interest may have been recorded for malformed symbols before they were rejected.
+        return [symbol for symbol in map(bytes.decode, top) if SYMBOL_RE.fullmatch(symbol)]
+
+    async def _due(self, keys: List[str]) -> List[bool]:
+        # Due when missing or going stale before the next cycle could refresh it.
+        return [raw is None or swr.fresh_for(raw) < self.interval_seconds for raw in await mget_raw(keys)]
+
+    async def warm_once(self) -> Dict[str, int]:
+        """One refresh pass; returns how many entries of each kind it tried to refresh."""
+        budget = self.upstream_budget
+        attempted = {"assets": 0, "quotes": 0, "charts": 0}
+
+        assets_ttl = await get_redis_client().ttl(ASSETS_CACHE_KEY)
+        if budget > 0 and assets_ttl != -1 and assets_ttl < ASSETS_REFRESH_LEAD_SECONDS:
+            attempted["assets"] = 1
+            budget -= 1
+            await self._refresh("assets", singleflight.do(ASSETS_CACHE_KEY, refresh_assets))
+
+        symbols = await self._top_symbols()
+        if not symbols:
+            return attempted
+
+        due_quotes = [s for s, due in zip(symbols, await self._due([quote_cache_key(s) for s in symbols])) if due]
+        if budget > 0 and due_quotes:
+            attempted["quotes"] = len(due_quotes)
+            budget -= 1
+            await self._refresh("quotes", refresh_quotes(due_quotes))
+
+        # The default chart view; each refresh costs at most a tail sync of new bars upstream.
+        specs = [ChartSpec(symbol) for symbol in symbols]
+        due_charts = [spec for spec, due in zip(specs, await self._due([s.cache_key for s in specs])) if due]
+        due_charts = due_charts[: max(budget, 0)]
+        attempted["charts"] = len(due_charts)
+        await asyncio.gather(
+            *(
+                self._refresh("charts", singleflight.do(spec.cache_key, lambda spec=spec: refresh_chart(spec)))
+                for spec in due_charts
+            )
+        )
+        return attempted
+
+    async def _refresh(self, kind: str, refresh: Awaitable[object]) -> None:
+        try:
+            await refresh
+            refreshes.inc(kind=kind, result="ok")
+        except Exception as exc:
+            refreshes.inc(kind=kind, result="error")
+            logger.warning("Prewarm of %s failed: %r", kind, exc)
+
+
+prewarmer = Prewarmer(
+    interval_seconds=settings.prewarm_interval_seconds,
+    top_symbols=settings.prewarm_top_symbols,
+    upstream_budget=settings.prewarm_upstream_budget,
+)
+
+
+async def _main() -> None:
+    try:
+        await prewarmer.run(warm=True)
+    finally:
+        await close_http_clients()
+        await close_redis()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+from app.core.config import settings
+from app.services.quotes import load_quotes_raw
+
+logger = logging.getLogger(__name__)
+
+# Subscribed symbols are loaded in chunks of this size, so a symbol upstream rejects only holds
+# back the updates of its own chunk.
+REFRESH_CHUNK_SYMBOLS = 50
+
+
+class Subscription:
+    def __init__(self) -> None:
+        self.symbols: Set[str] = set()
+        self._pending: Dict[str, bytes] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, quotes: Dict[str, bytes]) -> None:
+        # Updates are merged rather than queued, so a slow client only ever receives the
+        # latest quote per symbol and memory stays bounded by its subscription size.
+        self._pending.update(quotes)
+        self._ready.set()
+
+    async def next_batch(self) -> Dict[str, bytes]:
+        await self._ready.wait()
+        self._ready.clear()
+        batch, self._pending = self._pending, {}
+        return batch
+
+
+class QuoteHub:
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._subscriptions: Set[Subscription] = set()
+        self._refcounts: Dict[str, int] = {}
+        self._latest: Dict[str, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def connect(self) -> Subscription:
+        subscription = Subscription()
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def disconnect(self, subscription: Subscription) -> None:
+        self.unsubscribe(subscription, list(subscription.symbols))
+        self._subscriptions.discard(subscription)
+
+    def subscribe(self, subscription: Subscription, symbols: Iterable[str]) -> None:
+        added = [symbol for symbol in symbols if symbol not in subscription.symbols]
+        for symbol in added:
+            subscription.symbols.add(symbol)
+            self._refcounts[symbol] = self._refcounts.get(symbol, 0) + 1
+        known = {symbol: self._latest[symbol] for symbol in added if symbol in self._latest}
+        if known:
+            subscription.push(known)
+        if added:
+            self._ensure_running()
+
+    def unsubscribe(self, subscription: Subscription, symbols: Iterable[str]) -> None:
+        for symbol in symbols:
+            if symbol not in subscription.symbols:
+                continue
+            subscription.symbols.discard(symbol)
+            remaining = self._refcounts.get(symbol, 0) - 1
+            if remaining > 0:
+                self._refcounts[symbol] = remaining
+            else:
+                self._refcounts.pop(symbol, None)
+                self._latest.pop(symbol, None)
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while self._refcounts:
+            try:
+                await self._refresh()
+            except Exception:
+                logger.exception("Quote hub refresh failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _refresh(self) -> None:
+        symbols = sorted(self._refcounts)
+        chunks = [symbols[i : i + REFRESH_CHUNK_SYMBOLS] for i in range(0, len(symbols), REFRESH_CHUNK_SYMBOLS)]
+        quotes: Dict[str, bytes] = {}
+        # Chunks are still fetched together (their misses share a batch), and one failing is
+        # retried on its own without failing the rest.
+        results = await asyncio.gather(*(load_quotes_raw(chunk) for chunk in chunks), return_exceptions=True)
+        for chunk, loaded in zip(chunks, results):
+            if isinstance(loaded, Exception):
+                logger.warning("Quote hub refresh failed for %s..%s: %r", chunk[0], chunk[-1], loaded)
+            else:
+                quotes.update(loaded)
+        changed = {
+            symbol: quote
+            for symbol, quote in quotes.items()
+            if symbol in self._refcounts and self._latest.get(symbol) != quote
+        }
+        if not changed:
+            return
+        self._latest.update(changed)
+        for subscription in self._subscriptions:
+            update = {symbol: changed[symbol] for symbol in subscription.symbols if symbol in changed}
+            if update:
+                subscription.push(update)
+
+
+quote_hub = QuoteHub(interval_seconds=settings.quote_stream_interval_seconds)
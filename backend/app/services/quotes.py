@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from app.services import singleflight, swr
+from app.services.alpaca_client import fetch_latest_quotes
+from app.services.batching import KeyBatcher
+from app.services.prev_close import previous_closes
+from app.services.symbols import check_symbols
+
+QUOTE_CACHE_PREFIX = "quote:delayed_sip:"
+QUOTE_TTL_SECONDS = 20
+# How long past QUOTE_TTL_SECONDS a quote may still be served while it is being refreshed.
+QUOTE_STALE_SECONDS = 10 * 60
+# Misses from concurrent requests arriving this close together are fetched in one upstream call.
+QUOTE_BATCH_WINDOW_SECONDS = 0.01
+
+
+def quote_cache_key(symbol: str) -> str:
+    return f"{QUOTE_CACHE_PREFIX}{symbol}"
+
+
+def build_quotes(symbols: List[str], raw_quotes: Dict[str, Any], prev_closes: np.ndarray) -> Dict[str, bytes]:
+    """
+    Serialized quotes for `symbols` from Alpaca's latest quotes and previous closes aligned with
+    them. last (the mid, or whichever side is quoted), mid and changePct are computed for all
+    symbols at once; NaN marks a missing value and is sent as null.
+    """
+    raws = [raw_quotes.get(symbol) or {} for symbol in symbols]
+    bids = [raw.get("bp") for raw in raws]
+    asks = [raw.get("ap") for raw in raws]
+    bid = np.array(bids, dtype=np.float64)
+    ask = np.array(asks, dtype=np.float64)
+    mid = np.round((bid + ask) / 2, 4)
+    last = np.where(np.isnan(mid), np.where(np.isnan(ask), bid, ask), mid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(prev_closes > 0, np.round((last / prev_closes - 1) * 100, 4), np.nan)
+
+    def nullable(values: np.ndarray) -> List[Optional[float]]:
+        return [None if value != value else value for value in values.tolist()]
+
+    return {
+        symbol: orjson.dumps(
+            {
+                "symbol": symbol,
+                "last": last_value,
+                "mid": mid_value,
+                "bid": bid_value,
+                "ask": ask_value,
+                "changePct": change_value,
+                "updatedAt": raw.get("t"),
+            }
+        )
+        for symbol, raw, bid_value, ask_value, last_value, mid_value, change_value in zip(
+            symbols, raws, bids, asks, nullable(last), nullable(mid), nullable(change)
+        )
+    }
+
+
+async def refresh_quotes(symbols: List[str]) -> Dict[str, bytes]:
+    """Fetch `symbols` upstream and cache them."""
+    data, prev_closes = await asyncio.gather(fetch_latest_quotes(symbols), previous_closes.lookup(symbols))
+    quotes = build_quotes(symbols, data.get("quotes", {}), prev_closes)
+    await swr.mset_entries(
+        {quote_cache_key(symbol): raw for symbol, raw in quotes.items()}, QUOTE_TTL_SECONDS, QUOTE_STALE_SECONDS
+    )
+    return quotes
+
+
+async def _cached_quotes(symbols: List[str], fresh_only: bool = False) -> Optional[Dict[str, bytes]]:
+    entries = await swr.mget_entries([quote_cache_key(symbol) for symbol in symbols])
+    if any(entry is None or (fresh_only and not entry[1]) for entry in entries):
+        return None
+    return {symbol: entry[0] for symbol, entry in zip(symbols, entries)}
+
+
+def _fetch_missing(symbols: List[str]) -> Awaitable[Dict[str, bytes]]:
+    return singleflight.do(
+        f"{QUOTE_CACHE_PREFIX}{','.join(symbols)}",
+        lambda: refresh_quotes(symbols),
+        cached=lambda: _cached_quotes(symbols),
+    )
+
+
+_missing_quotes = KeyBatcher("quotes", _fetch_missing, QUOTE_BATCH_WINDOW_SECONDS)
+
+
+async def load_quotes_with_staleness(symbols: List[str]) -> Tuple[Dict[str, bytes], bool]:
+    """
+    Return serialized quotes for `symbols`, read per symbol from Redis in one MGET, and whether
+    any of them is past its fresh lifetime. Stale quotes are served as-is and refreshed in the
+    background; only symbols missing from the cache are fetched inline, in one batched call
+    shared with concurrent callers. Raises ValueError for a malformed symbol.
+    """
+    unique = list(dict.fromkeys(symbols))
+    check_symbols(unique)
+    entries = await swr.mget_entries([quote_cache_key(symbol) for symbol in unique])
+    quotes = {symbol: entry[0] for symbol, entry in zip(unique, entries) if entry is not None}
+
+    stale = sorted(symbol for symbol, entry in zip(unique, entries) if entry is not None and not entry[1])
+    if stale:
+        swr.revalidate(
+            f"{QUOTE_CACHE_PREFIX}{','.join(stale)}",
+            lambda: refresh_quotes(stale),
+            cached=lambda: _cached_quotes(stale, fresh_only=True),
+        )
+
+    missing = sorted(symbol for symbol in unique if symbol not in quotes)
+    if missing:
+        quotes.update(await _missing_quotes.load(missing))
+    return {symbol: quotes[symbol] for symbol in unique}, bool(stale)
+
+
+async def load_quotes_raw(symbols: List[str]) -> Dict[str, bytes]:
+    return (await load_quotes_with_staleness(symbols))[0]
+
+
+async def load_quotes(symbols: List[str]) -> Dict[str, dict]:
+    return {symbol: orjson.loads(raw) for symbol, raw in (await load_quotes_raw(symbols)).items()}
+
+
+def quotes_response_body(as_of: str, quotes: Dict[str, bytes], stale: bool = False) -> bytes:
+    # Splice the cached per-symbol JSON into the response instead of decoding and re-encoding it.
+    entries = b",".join(orjson.dumps(symbol) + b":" + raw for symbol, raw in quotes.items())
+    body = b'{"asOf":' + orjson.dumps(as_of) + b',"quotes":{' + entries + b"}}"
+    return swr.with_stale_flag(body) if stale else body
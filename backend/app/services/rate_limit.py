@@ -0,0 +1,159 @@
+"""
+Redis token buckets shared by all workers: one guarding the Alpaca quota, and one per client on
+the market API.
+
+Upstream calls are tagged interactive (the default) or background through a context variable.
+Background calls must leave `alpaca_rate_limit_background_reserve` of the bucket untouched, so
+user-facing quotes and charts still get through while pre-warming or bulk work is saturating the
+quota. A 429 from Alpaca pauses every worker's upstream calls for its Retry-After.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import counter, histogram
+from app.services.redis_client import get_redis_client
+
+UPSTREAM_BUCKET_KEY = "ratelimit:alpaca"
+UPSTREAM_BACKOFF_KEY = "ratelimit:alpaca:backoff"
+CLIENT_BUCKET_PREFIX = "ratelimit:client:"
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+upstream_priority: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+upstream_wait_seconds = histogram(
+    "alpaca_rate_limit_wait_seconds", "Time upstream calls waited for a rate limit token", labels=("priority",)
+)
+throttled = counter("rate_limit_throttled_total", "Requests refused by a rate limiter", labels=("limiter",))
+
+# KEYS[1]: bucket hash; KEYS[2] (optional): backoff key whose PTTL blocks all takers.
+# ARGV: refill rate per ms, capacity, now (ms), tokens requested, tokens that must remain after.
+# Returns 0 when the tokens were taken, else the milliseconds to wait before retrying.
+_TOKEN_BUCKET_SCRIPT = """
+if #KEYS > 1 then
+    local backoff = redis.call('pttl', KEYS[2])
+    if backoff > 0 then return backoff end
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local needed = requested + tonumber(ARGV[5])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= needed then
+    tokens = tokens - requested
+else
+    wait = math.ceil((needed - tokens) / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate) + 1000)
+return wait
+"""
+
+
+class UpstreamThrottled(httpx.TransportError):
+    """Raised instead of calling Alpaca when no token is available within the allowed wait."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Upstream rate limit reached; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, key: str, per_minute: float, capacity: float, backoff_key: Optional[str] = None) -> None:
+        self.key = key
+        self.rate_per_ms = per_minute / 60_000
+        self.capacity = capacity
+        self.backoff_key = backoff_key
+
+    async def take(self, tokens: float = 1, reserve: float = 0) -> float:
+        """Take `tokens` if at least `reserve` would remain; else return the seconds to wait."""
+        keys = [self.key, self.backoff_key] if self.backoff_key else [self.key]
+        wait_ms = await get_redis_client().eval(
+            _TOKEN_BUCKET_SCRIPT,
+            len(keys),
+            *keys,
+            repr(self.rate_per_ms),
+            repr(self.capacity),
+            int(time.time() * 1000),
+            repr(tokens),
+            repr(reserve),
+        )
+        return int(wait_ms) / 1000
+
+
+upstream_bucket = TokenBucket(
+    UPSTREAM_BUCKET_KEY,
+    per_minute=settings.alpaca_rate_limit_per_minute,
+    capacity=settings.alpaca_rate_limit_burst,
+    backoff_key=UPSTREAM_BACKOFF_KEY,
+)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """Mark upstream calls made inside the block (and tasks it creates) as background work."""
+    token = upstream_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        upstream_priority.reset(token)
+
+
+async def acquire_upstream() -> None:
+    """Wait for an Alpaca token; raises UpstreamThrottled if that would exceed the priority's budget."""
+    priority = upstream_priority.get()
+    if priority == BACKGROUND:
+        reserve = settings.alpaca_rate_limit_burst * settings.alpaca_rate_limit_background_reserve
+        max_wait = settings.alpaca_rate_limit_background_max_wait
+    else:
+        reserve, max_wait = 0.0, settings.alpaca_rate_limit_max_wait
+    started = time.monotonic()
+    try:
+        while True:
+            wait = await upstream_bucket.take(reserve=reserve)
+            if wait <= 0:
+                return
+            waited = time.monotonic() - started
+            if waited + wait > max_wait:
+                throttled.inc(limiter=f"upstream_{priority}")
+                raise UpstreamThrottled(wait)
+            await asyncio.sleep(wait)
+    finally:
+        upstream_wait_seconds.observe(time.monotonic() - started, priority=priority)
+
+
+async def pause_upstream(retry_after: float) -> None:
+    """Hold back every worker's upstream calls after Alpaca answered 429."""
+    await get_redis_client().set(UPSTREAM_BACKOFF_KEY, b"1", px=max(int(retry_after * 1000), 1))
+
+
+def parse_retry_after(response: httpx.Response, default: float = 1.0) -> float:
+    value = response.headers.get("retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else default
+    except ValueError:
+        return default
+
+
+async def take_client_token(client_id: str) -> float:
+    """Per-client limiter for the market API: 0 if allowed, else seconds until retry."""
+    bucket = TokenBucket(
+        f"{CLIENT_BUCKET_PREFIX}{client_id}",
+        per_minute=settings.market_rate_limit_per_minute,
+        capacity=settings.market_rate_limit_burst,
+    )
+    wait = await bucket.take()
+    if wait > 0:
+        throttled.inc(limiter="client")
+    return wait
@@ -1,28 +1,350 @@
-import json
-from functools import lru_cache
-from typing import Any, Optional
+import asyncio
+import logging
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
 
+import orjson
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
 
 from app.core.config import settings
+from app.core.metrics import counter, histogram
+from app.services.local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+INVALIDATION_RETRY_SECONDS = 1.0
+# The listener wakes this often even when idle, which is also when pub/sub health checks run.
+INVALIDATION_POLL_SECONDS = 5.0
+
+cache_requests = counter(
+    "cache_requests_total", "Cache lookups by tier, key prefix and result", labels=("tier", "prefix", "result")
+)
+
+redis_seconds = histogram(
+    "cache_redis_seconds", "Redis round trips made by the cache, by operation and key prefix", labels=("op", "prefix")
+)
+
+command_seconds = histogram("redis_command_seconds", "Redis command latency by command", labels=("command",))
+
+local_cache = LocalCache(settings.cache_l1_max_entries, settings.cache_l1_max_ttl_seconds)
+
+_instance_id = secrets.token_hex(8)
+_client: Optional[aioredis.Redis] = None
+_invalidation_task: Optional[asyncio.Task] = None
+# Called with each key another instance invalidates, for in-process state outside local_cache.
+_invalidation_hooks: List[Callable[[str], None]] = []
+_UNDECODED = object()
+
+
+class _Entry:
+    # Holds the serialized bytes and decodes them at most once, on first JSON read.
+    __slots__ = ("raw", "_value")
+
+    def __init__(self, raw: bytes, value: Any = _UNDECODED) -> None:
+        self.raw = raw
+        self._value = value
+
+    def value(self) -> Optional[Any]:
+        if self._value is _UNDECODED:
+            self._value = _decode(self.raw)
+        return self._value
+
+
+class _InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            command_seconds.observe(time.perf_counter() - started, command="pipeline")
+
+
+class _InstrumentedRedis(aioredis.Redis):
+    """Times every command by name; a pipeline is timed once, as "pipeline"."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command_seconds.observe(time.perf_counter() - started, command=str(args[0]).lower())
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return _InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
 
-@lru_cache(maxsize=1)
 def get_redis_client() -> aioredis.Redis:
-    return aioredis.from_url(settings.redis_url, decode_responses=True)
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
 
 
-async def get_json(key: str) -> Optional[Any]:
-    client = get_redis_client()
-    raw = await client.get(key)
-    if raw is None:
-        return None
+def _create_client() -> aioredis.Redis:
+    # A blocking pool makes callers wait up to REDIS_POOL_TIMEOUT for a free connection instead
+    # of failing as soon as REDIS_MAX_CONNECTIONS are in use.
+    pool = aioredis.BlockingConnectionPool.from_url(
+        settings.redis_url,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_socket_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+    )
+    return _InstrumentedRedis(connection_pool=pool)
+
+
+@asynccontextmanager
+async def pipeline(transaction: bool = False) -> AsyncIterator[Pipeline]:
+    """
+    Queue commands on the yielded pipeline; they are sent in one round trip when the block exits.
+    Call `await pipe.execute()` inside the block instead when the replies are needed.
+    """
+    async with get_redis_client().pipeline(transaction=transaction) as pipe:
+        yield pipe
+        await pipe.execute()
+
+
+async def close_redis() -> None:
+    """Stop the invalidation listener and close the pool's connections."""
+    global _client, _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        try:
+            await _invalidation_task
+        except asyncio.CancelledError:
+            pass
+        _invalidation_task = None
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose(close_connection_pool=True)
+
+
+def _prefix(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def _decode(raw: bytes) -> Optional[Any]:
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
         return None
 
 
+def _remember(key: str, entry: _Entry, pttl_ms: int) -> None:
+    # PTTL is -1 for keys without expiry and -2 if the key vanished after the GET.
+    if pttl_ms == -1:
+        local_cache.set(key, entry, local_cache.max_ttl_seconds)
+    elif pttl_ms > 0:
+        local_cache.set(key, entry, pttl_ms / 1000)
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        pubsub = get_redis_client().pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                # Polled rather than pubsub.listen(), which would trip the socket timeout when idle.
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=INVALIDATION_POLL_SECONDS)
+                # A cancellation that lands as a message arrives can be swallowed by the read's
+                # timeout handling (asyncio.wait_for before 3.12), so shutdown would hang here.
+                if asyncio.current_task().cancelling():
+                    raise asyncio.CancelledError
+                if message is None or message.get("type") != "message":
+                    continue
+                origin, _, key = message["data"].decode().partition(":")
+                if origin != _instance_id:
+                    local_cache.delete(key)
+                    for hook in _invalidation_hooks:
+                        hook(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener failed; clearing local cache")
+            local_cache.clear()
+            await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+        finally:
+            await pubsub.aclose()
+
+
+def ensure_invalidation_listener() -> None:
+    global _invalidation_task
+    if not settings.cache_l1_invalidation:
+        return
+    if _invalidation_task is None or _invalidation_task.done():
+        _invalidation_task = asyncio.create_task(_listen_for_invalidations())
+
+
+def on_invalidation(hook: Callable[[str], None]) -> None:
+    """Call `hook` with every key another instance invalidates while the listener runs."""
+    _invalidation_hooks.append(hook)
+
+
+async def invalidate(key: str) -> None:
+    """Drop `key` from the local cache here and, through the invalidation channel, everywhere else."""
+    ensure_invalidation_listener()
+    local_cache.delete(key)
+    if settings.cache_l1_invalidation:
+        await get_redis_client().publish(INVALIDATION_CHANNEL, f"{_instance_id}:{key}")
+
+
+async def _mget_entries(keys: List[str]) -> List[Optional[_Entry]]:
+    ensure_invalidation_listener()
+    entries: List[Optional[_Entry]] = []
+    remote: List[int] = []
+    for index, key in enumerate(keys):
+        entry = local_cache.get(key)
+        cache_requests.inc(tier="l1", prefix=_prefix(key), result="miss" if entry is None else "hit")
+        entries.append(entry)
+        if entry is None:
+            remote.append(index)
+    if not remote:
+        return entries
+
+    client = get_redis_client()
+    remote_keys = [keys[index] for index in remote]
+    with redis_seconds.timer(op="get", prefix=_prefix(remote_keys[0])):
+        if local_cache.max_entries <= 0:
+            raw_values, pttls = await client.mget(remote_keys), [-2] * len(remote_keys)
+        else:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.mget(remote_keys)
+                for key in remote_keys:
+                    pipe.pttl(key)
+                raw_values, *pttls = await pipe.execute()
+    for index, key, raw, pttl_ms in zip(remote, remote_keys, raw_values, pttls):
+        cache_requests.inc(tier="redis", prefix=_prefix(key), result="miss" if raw is None else "hit")
+        if raw is not None:
+            entry = _Entry(raw)
+            _remember(key, entry, pttl_ms)
+            entries[index] = entry
+    return entries
+
+
+async def get_raw(key: str) -> Optional[bytes]:
+    """Return the cached JSON bytes for `key` without decoding them."""
+    entry = (await _mget_entries([key]))[0]
+    return entry.raw if entry is not None else None
+
+
+async def mget_raw(keys: List[str]) -> List[Optional[bytes]]:
+    if not keys:
+        return []
+    return [entry.raw if entry is not None else None for entry in await _mget_entries(keys)]
+
+
+async def get_json(key: str) -> Optional[Any]:
+    entry = (await _mget_entries([key]))[0]
+    return entry.value() if entry is not None else None
+
+
+async def mget_json(keys: List[str]) -> List[Optional[Any]]:
+    if not keys:
+        return []
+    return [entry.value() if entry is not None else None for entry in await _mget_entries(keys)]
+
+
+def _ttl_for(ttl_seconds: Union[int, Dict[str, int]], key: str) -> int:
+    return ttl_seconds[key] if isinstance(ttl_seconds, dict) else ttl_seconds
+
+
+async def _mset_entries(entries: Dict[str, _Entry], ttl_seconds: Union[int, Dict[str, int]]) -> None:
+    if not entries:
+        return
+    ensure_invalidation_listener()
+    with redis_seconds.timer(op="set", prefix=_prefix(next(iter(entries)))):
+        async with pipeline() as pipe:
+            for key, entry in entries.items():
+                pipe.set(key, entry.raw, ex=_ttl_for(ttl_seconds, key))
+                if settings.cache_l1_invalidation:
+                    pipe.publish(INVALIDATION_CHANNEL, f"{_instance_id}:{key}")
+    for key, entry in entries.items():
+        local_cache.set(key, entry, _ttl_for(ttl_seconds, key))
+
+
+async def set_raw(key: str, raw: bytes, ttl_seconds: int) -> None:
+    await _mset_entries({key: _Entry(raw)}, ttl_seconds)
+
+
+async def mset_raw(values: Dict[str, bytes], ttl_seconds: Union[int, Dict[str, int]]) -> None:
+    """Store every value in one round trip; `ttl_seconds` is one TTL for all keys or one per key."""
+    await _mset_entries({key: _Entry(raw) for key, raw in values.items()}, ttl_seconds)
+
+
 async def set_json(key: str, value: Any, ttl_seconds: int) -> None:
+    await _mset_entries({key: _Entry(orjson.dumps(value), value)}, ttl_seconds)
+
+
+async def mset_json(values: Dict[str, Any], ttl_seconds: Union[int, Dict[str, int]]) -> None:
+    """Store every value in one round trip; `ttl_seconds` is one TTL for all keys or one per key."""
+    await _mset_entries({key: _Entry(orjson.dumps(value), value) for key, value in values.items()}, ttl_seconds)
+
+
+# Applies a delta to a cached {"v": version, "items": [...]} document, but only when it is at the
+# version just before ARGV[5]; a document at any other version missed an edit and is dropped.
+# Drops ARGV[3] members, prepends ARGV[2] members (both JSON arrays) and keeps the key's expiry.
+_EDIT_VERSIONED_LIST_SCRIPT = """
+local raw = redis.call('get', KEYS[1])
+if not raw then
+    return false
+end
+local doc = cjson.decode(raw)
+if tonumber(doc.v) ~= tonumber(ARGV[5]) - 1 then
+    redis.call('del', KEYS[1])
+    if ARGV[1] ~= '' then redis.call('publish', ARGV[4], ARGV[1]) end
+    return false
+end
+local drop = {}
+for _, value in ipairs(cjson.decode(ARGV[2])) do drop[value] = true end
+for _, value in ipairs(cjson.decode(ARGV[3])) do drop[value] = true end
+local items = {}
+for _, value in ipairs(cjson.decode(ARGV[2])) do table.insert(items, value) end
+for _, value in ipairs(doc.items) do
+    if not drop[value] then table.insert(items, value) end
+end
+local encoded_items = '[]'
+if #items > 0 then encoded_items = cjson.encode(items) end
+local encoded = '{"v":' .. cjson.encode(ARGV[5]) .. ',"items":' .. encoded_items .. '}'
+redis.call('set', KEYS[1], encoded, 'KEEPTTL')
+if ARGV[1] ~= '' then redis.call('publish', ARGV[4], ARGV[1]) end
+return encoded
+"""
+
+
+async def edit_versioned_list(
+    key: str, version: str, prepend: List[Any], remove: List[Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Atomically move the {"v", "items"} document cached at `key` to `version` by removing `remove`
+    and prepending `prepend`, so concurrent edits from several workers never overwrite each
+    other. Versions are decimal strings. Returns the new document, or None if nothing usable was
+    cached (the caller should then rebuild it from the source of truth).
+    """
+    ensure_invalidation_listener()
     client = get_redis_client()
-    await client.set(key, json.dumps(value), ex=ttl_seconds)
+    message = f"{_instance_id}:{key}" if settings.cache_l1_invalidation else ""
+    with redis_seconds.timer(op="edit", prefix=_prefix(key)):
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.eval(
+                _EDIT_VERSIONED_LIST_SCRIPT,
+                1,
+                key,
+                message,
+                orjson.dumps(prepend),
+                orjson.dumps(remove),
+                INVALIDATION_CHANNEL,
+                version,
+            )
+            pipe.pttl(key)
+            raw, pttl_ms = await pipe.execute()
+    if raw is None:
+        local_cache.delete(key)
+        return None
+    entry = _Entry(raw)
+    _remember(key, entry, pttl_ms)
+    return entry.value()
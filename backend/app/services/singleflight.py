@@ -0,0 +1,85 @@
+import asyncio
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.core.metrics import counter
+from app.services.redis_client import get_redis_client
+
+T = TypeVar("T")
+
+LOCK_PREFIX = "singleflight:"
+DEFAULT_LEASE_SECONDS = 10.0
+POLL_INTERVAL_SECONDS = 0.05
+
+# outcome: leader (ran the upstream call), local (joined an in-process flight),
+# remote (picked up another worker's result), fallback (lease wait gave up).
+calls = counter("singleflight_calls_total", "Single-flight calls by outcome", labels=("outcome",))
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_inflight: Dict[str, "asyncio.Task[Any]"] = {}
+
+
+async def _run_leased(
+    key: str,
+    fn: Callable[[], Awaitable[T]],
+    cached: Optional[Callable[[], Awaitable[Optional[T]]]],
+    lease_seconds: float,
+) -> T:
+    client = get_redis_client()
+    lock_key = f"{LOCK_PREFIX}{key}"
+    token = secrets.token_hex(8)
+    if await client.set(lock_key, token, nx=True, px=int(lease_seconds * 1000)):
+        calls.inc(outcome="leader")
+        try:
+            return await fn()
+        finally:
+            await client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+
+    if cached is not None:
+        deadline = time.monotonic() + lease_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            value = await cached()
+            if value is not None:
+                calls.inc(outcome="remote")
+                return value
+            if not await client.exists(lock_key):
+                break
+
+    calls.inc(outcome="fallback")
+    return await fn()
+
+
+def _forget(key: str, task: "asyncio.Task[Any]") -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()
+
+
+async def do(
+    key: str,
+    fn: Callable[[], Awaitable[T]],
+    *,
+    cached: Optional[Callable[[], Awaitable[Optional[T]]]] = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+) -> T:
+    """
+    Run `fn` at most once per key across concurrent callers. In-process callers share one task;
+    other workers wait on a Redis lease and poll `cached` for the leader's result.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_leased(key, fn, cached, lease_seconds))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    else:
+        calls.inc(outcome="local")
+    return await asyncio.shield(task)
@@ -0,0 +1,108 @@
+"""
+Stale-while-revalidate cache entries.
+
+Values are stored as b"<fresh-until, epoch ms>\n" + body, with a Redis TTL that runs past the
+fresh-until time by a stale window. Readers serve a stale body immediately and refresh it in the
+background, so expiry never puts an upstream round trip in front of a user, and an upstream
+outage degrades to stale data instead of errors. Fresh lifetimes are jittered so keys written
+together do not all go stale together.
+"""
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.metrics import counter
+from app.services import singleflight
+from app.services.rate_limit import background_priority
+from app.services.redis_client import get_raw, mget_raw, mset_raw
+
+logger = logging.getLogger(__name__)
+
+FRESH_JITTER = 0.1
+# After a failed refresh, the key keeps serving stale data this long before the next attempt.
+RETRY_AFTER_FAILURE_SECONDS = 5.0
+
+revalidations = counter("swr_revalidations_total", "Background refreshes of stale entries", labels=("prefix", "result"))
+
+# Keeps a reference to each running refresh task, keyed by cache key.
+_refreshing: Dict[str, "asyncio.Task[None]"] = {}
+
+
+def pack(body: bytes, fresh_seconds: float) -> bytes:
+    fresh_until_ms = int((time.time() + fresh_seconds * random.uniform(1 - FRESH_JITTER, 1 + FRESH_JITTER)) * 1000)
+    return b"%d\n%s" % (fresh_until_ms, body)
+
+
+def unpack(raw: bytes) -> Tuple[bytes, bool]:
+    """(body, is_fresh). Values written before this format are treated as stale."""
+    header, sep, body = raw.partition(b"\n")
+    if not sep or not header.isdigit():
+        return raw, False
+    return body, int(header) > time.time() * 1000
+
+
+def fresh_for(raw: bytes) -> float:
+    """Seconds until `raw` goes stale; zero or less once it is stale."""
+    header, sep, _ = raw.partition(b"\n")
+    if not sep or not header.isdigit():
+        return 0.0
+    return int(header) / 1000 - time.time()
+
+
+async def mget_entries(keys: List[str]) -> List[Optional[Tuple[bytes, bool]]]:
+    return [unpack(raw) if raw is not None else None for raw in await mget_raw(keys)]
+
+
+async def get_entry(key: str) -> Optional[Tuple[bytes, bool]]:
+    raw = await get_raw(key)
+    return unpack(raw) if raw is not None else None
+
+
+async def get_fresh(key: str) -> Optional[bytes]:
+    entry = await get_entry(key)
+    return entry[0] if entry is not None and entry[1] else None
+
+
+async def mset_entries(values: Dict[str, bytes], fresh_seconds: float, stale_seconds: float) -> None:
+    ttl_seconds = math.ceil(fresh_seconds * (1 + FRESH_JITTER) + stale_seconds)
+    await mset_raw({key: pack(body, fresh_seconds) for key, body in values.items()}, ttl_seconds=ttl_seconds)
+
+
+async def set_entry(key: str, body: bytes, fresh_seconds: float, stale_seconds: float) -> None:
+    await mset_entries({key: body}, fresh_seconds, stale_seconds)
+
+
+def with_stale_flag(body: bytes) -> bytes:
+    """Splice "stale": true into a JSON object body."""
+    return b'{"stale":true,' + body[1:] if body != b"{}" else b'{"stale":true}'
+
+
+def revalidate(
+    key: str,
+    refresh: Callable[[], Awaitable[object]],
+    cached: Optional[Callable[[], Awaitable[Optional[object]]]] = None,
+) -> None:
+    """
+    Refresh `key` in the background, at most once per worker at a time and through singleflight
+    across workers. `cached` should return a value only once the entry is fresh again.
+    """
+    if key in _refreshing:
+        return
+
+    async def run() -> None:
+        prefix = key.split(":", 1)[0]
+        try:
+            with background_priority():
+                await singleflight.do(key, refresh, cached=cached)
+            revalidations.inc(prefix=prefix, result="ok")
+        except Exception as exc:
+            revalidations.inc(prefix=prefix, result="error")
+            logger.warning("Background refresh of %s failed, serving stale data: %r", key, exc)
+            await asyncio.sleep(RETRY_AFTER_FAILURE_SECONDS)
+        finally:
+            _refreshing.pop(key, None)
+
+    _refreshing[key] = asyncio.create_task(run())
@@ -0,0 +1,19 @@
+import re
+from typing import Iterable, List
+
+SYMBOL_RE = re.compile(r"^[A-Z0-9\.]{1,16}$")
+
+
+def invalid_symbols(symbols: Iterable[str]) -> List[str]:
+    """The symbols that are not normalized (uppercased, stripped) tickers."""
+    return [symbol for symbol in symbols if not SYMBOL_RE.fullmatch(symbol)]
+
+
+def check_symbols(symbols: Iterable[str]) -> None:
+    """
+    Raise ValueError for malformed symbols. Called before any cache or upstream access, so client
+    input never reaches a key or a batched Alpaca request shared with other callers.
+    """
+    invalid = invalid_symbols(symbols)
+    if invalid:
+        raise ValueError(f"Invalid symbol: {invalid[0]}")
@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import List, Optional
+
+import httpx
+
+from app.services.quotes import load_quotes_raw
+from app.services.rate_limit import background_priority
+from app.services.redis_client import edit_versioned_list, get_json, get_redis_client, set_json
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_CACHE_PREFIX = "watchlist:"
+WATCHLIST_VERSION_PREFIX = "watchlist_version:"
+WATCHLIST_TTL_SECONDS = 60 * 60
+
+
+def watchlist_cache_key(user_id: int) -> str:
+    return f"{WATCHLIST_CACHE_PREFIX}{user_id}"
+
+
+def watchlist_version_key(user_id: int) -> str:
+    return f"{WATCHLIST_VERSION_PREFIX}{user_id}"
+
+
+def _initial_version() -> int:
+    # Counters start from the clock, so a version lost with Redis is never handed out again and
+    # an old ETag cannot match a different list.
+    return int(time.time() * 1000)
+
+
+async def current_version(user_id: int) -> str:
+    client = get_redis_client()
+    key = watchlist_version_key(user_id)
+    version = await client.get(key)
+    if version is None:
+        await client.set(key, _initial_version(), nx=True)
+        version = await client.get(key)
+    return version.decode()
+
+
+async def bump_version(user_id: int) -> str:
+    """Called after every committed mutation; invalidates every cached list and ETag."""
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        key = watchlist_version_key(user_id)
+        pipe.set(key, _initial_version(), nx=True)
+        pipe.incr(key)
+        _, version = await pipe.execute()
+    return str(version)
+
+
+async def get_cached_symbols(user_id: int, version: str) -> Optional[List[str]]:
+    doc = await get_json(watchlist_cache_key(user_id))
+    if not isinstance(doc, dict) or doc.get("v") != version:
+        return None
+    return doc["items"]
+
+
+async def store_symbols(user_id: int, version: str, symbols: List[str]) -> None:
+    await set_json(watchlist_cache_key(user_id), {"v": version, "items": symbols}, WATCHLIST_TTL_SECONDS)
+
+
+async def apply_delta(user_id: int, version: str, added: List[str], removed: List[str]) -> Optional[List[str]]:
+    """Move the cached list to `version` in place; None means it has to be rebuilt."""
+    doc = await edit_versioned_list(watchlist_cache_key(user_id), version, added, removed)
+    return doc["items"] if doc is not None else None
+
+
+async def prewarm_quotes(symbols: List[str]) -> None:
+    """Fill the quote cache for a changed watchlist, so the next quotes poll is all hits."""
+    if not symbols:
+        return
+    try:
+        with background_priority():
+            await load_quotes_raw(symbols)
+    except httpx.HTTPError:
+        logger.warning("Could not prewarm quotes for %d symbols", len(symbols))
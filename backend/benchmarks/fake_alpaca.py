@@ -0,0 +1,190 @@
+"""
+A stand-in for the Alpaca trading and market data APIs, for benchmarks and offline runs.
+
+Serves the endpoints the backend calls (assets, latest quotes, snapshots, and single- and
+multi-symbol bars) from deterministic synthetic data, after a configurable latency and failing a
+configurable share of requests with 500. Benchmarks start it in-process; to point a running
+backend at it, start it on its own and set ALPACA_DATA_BASE and ALPACA_TRADE_BASE to its URL:
+
+    python -m benchmarks.fake_alpaca --port 9181 --latency-ms 40 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.services.bar_store import format_time, parse_timeframe
+
+SYLLABLES = ["ar", "bel", "cor", "dan", "el", "fin", "gar", "hol", "ion", "jet", "kor", "lum", "mar", "nor", "or",
+             "pan", "quin", "ros", "sol", "tor", "ul", "ver", "wex", "xan", "yor", "zen"]
+SUFFIXES = ["Holdings", "Systems", "Energy", "Therapeutics", "Capital", "Networks", "Foods", "Motors"]
+PAGE_LIMIT = 10000
+
+
+def asset_universe(count: int) -> List[Dict[str, Any]]:
+    """`count` synthetic US equities; symbols start with "ZB" so they never clash with real ones."""
+    assets = []
+    for i in range(count):
+        letters = "".join(chr(ord("A") + (i // 26**power) % 26) for power in (2, 1, 0))
+        first, second = SYLLABLES[i % 26], SYLLABLES[(i // 26) % 26]
+        name = f"{(first + second).capitalize()} {SUFFIXES[i % len(SUFFIXES)]} Inc"
+        assets.append({"symbol": f"ZB{letters}", "name": name, "status": "active", "tradable": True})
+    return assets
+
+
+@lru_cache(maxsize=None)
+def _base_price(symbol: str) -> float:
+    return 20 + int(hashlib.md5(symbol.encode()).hexdigest()[:6], 16) % 48000 / 100
+
+
+def _price(symbol: str, at: datetime) -> float:
+    # A smooth daily wave around the symbol's base price, so consecutive requests agree.
+    phase = at.timestamp() / 86400 * 2 * math.pi
+    return round(_base_price(symbol) * (1 + 0.02 * math.sin(phase + len(symbol))), 2)
+
+
+# Bars are deterministic, and cached so overlapping requests don't regenerate them: generating
+# them costs the shared CPU that the backend under test is measured on.
+@lru_cache(maxsize=1 << 18)
+def _bar(symbol: str, epoch: int) -> Dict[str, Any]:
+    t = datetime.fromtimestamp(epoch, timezone.utc)
+    close = _price(symbol, t)
+    return {"t": format_time(t), "o": close, "h": close, "l": close, "c": close, "v": 1000, "n": 10}
+
+
+def _bars(symbol: str, timeframe: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    step = int(parse_timeframe(timeframe).total_seconds())
+    first = math.ceil(start.timestamp() / step) * step
+    return [_bar(symbol, epoch) for epoch in range(first, int(end.timestamp()) + 1, step)]
+
+
+def _parse_time(value: Optional[str], default: datetime) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else default
+
+
+def create_app(
+    latency_ms: float = 40.0, jitter_ms: float = 10.0, error_rate: float = 0.0, assets: int = 2000
+) -> FastAPI:
+    app = FastAPI(title="Fake Alpaca")
+    universe = asset_universe(assets)
+    app.state.requests = Counter()
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        app.state.requests[request.url.path.split("/")[-1]] += 1
+        await asyncio.sleep(max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000)
+        if random.random() < error_rate:
+            return JSONResponse({"message": "simulated upstream failure"}, status_code=500)
+        return await call_next(request)
+
+    @app.get("/v2/assets")
+    async def get_assets() -> Response:
+        return ORJSONResponse(universe)
+
+    @app.get("/v2/stocks/quotes/latest")
+    async def latest_quotes(symbols: str) -> Response:
+        now = datetime.now(timezone.utc)
+        quotes = {}
+        for symbol in symbols.split(","):
+            price = _price(symbol, now)
+            quotes[symbol] = {"bp": round(price - 0.01, 2), "ap": round(price + 0.01, 2), "bs": 1, "as": 1,
+                              "t": format_time(now)}
+        return ORJSONResponse({"quotes": quotes})
+
+    @app.get("/v2/stocks/snapshots")
+    async def snapshots(symbols: str) -> Response:
+        today = int(datetime.now(timezone.utc).replace(hour=4, minute=0, second=0, microsecond=0).timestamp())
+        result = {}
+        for symbol in symbols.split(","):
+            result[symbol] = {"dailyBar": _bar(symbol, today), "prevDailyBar": _bar(symbol, today - 86400)}
+        return ORJSONResponse(result)
+
+    def page(items: List[Any], limit: int, page_token: Optional[str]) -> tuple:
+        offset = int(page_token or 0)
+        limit = min(limit, PAGE_LIMIT)
+        token = str(offset + limit) if offset + limit < len(items) else None
+        return items[offset : offset + limit], token
+
+    @app.get("/v2/stocks/{symbol}/bars")
+    async def symbol_bars(
+        symbol: str,
+        timeframe: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 1000,
+        page_token: Optional[str] = None,
+    ) -> Response:
+        now = datetime.now(timezone.utc)
+        bars = _bars(symbol, timeframe, _parse_time(start, now - timedelta(days=1)), _parse_time(end, now))
+        bars, token = page(bars, limit, page_token)
+        return ORJSONResponse({"symbol": symbol, "bars": bars, "next_page_token": token})
+
+    @app.get("/v2/stocks/bars")
+    async def multi_bars(
+        symbols: str,
+        timeframe: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 1000,
+        page_token: Optional[str] = None,
+    ) -> Response:
+        now = datetime.now(timezone.utc)
+        start_at, end_at = _parse_time(start, now - timedelta(days=1)), _parse_time(end, now)
+        rows = [(symbol, bar) for symbol in symbols.split(",") for bar in _bars(symbol, timeframe, start_at, end_at)]
+        rows, token = page(rows, limit, page_token)
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for symbol, bar in rows:
+            grouped.setdefault(symbol, []).append(bar)
+        return ORJSONResponse({"bars": grouped, "next_page_token": token})
+
+    return app
+
+
+class FakeAlpacaServer:
+    """Runs the fake API on 127.0.0.1:`port` inside the current event loop."""
+
+    def __init__(self, port: int, **options: Any) -> None:
+        self.app = create_app(**options)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def requests(self) -> Counter:
+        return self.app.state.requests
+
+    async def __aenter__(self) -> "FakeAlpacaServer":
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self.server.should_exit = True
+        await self._task
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=9181)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--assets", type=int, default=2000)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.assets)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
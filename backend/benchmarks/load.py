@@ -0,0 +1,342 @@
+"""
+Offline load scenarios for the market, watchlist and auth endpoints, compared with a baseline.
+
+The app runs in-process, with its lifespan, behind httpx's ASGI transport. Alpaca is replaced by
+benchmarks/fake_alpaca.py (started on FAKE_ALPACA_PORT unless ALPACA_DATA_BASE is set), Redis
+by fakeredis unless --real-redis is given, and the database is the Postgres at DATABASE_URL,
+migrated to head. Use a scratch database: bench users and the fake "ZB*" symbols' bars are
+deleted before and after the run. The Alpaca and per-client rate limits are lifted unless their
+environment variables are set, so results reflect the app rather than the quotas.
+
+Scenarios:
+  search     typists sending one /api/market/search per keystroke
+  quotes     clients polling /api/market/quotes for their own mix of symbols
+  charts     all clients requesting charts at once, right after every chart entry expired
+  signin     a spike of concurrent /auth/signin requests (bcrypt bound)
+  watchlist  clients polling their watchlist (with If-None-Match) and its snapshot
+
+Each reports p50/p95/p99 latency, throughput and non-2xx responses, and is compared with the
+baseline file; the exit status is 1 if any p95 or throughput is worse than --tolerance allows,
+or a scenario's share of failed requests grew by more than two points.
+
+The fake upstream shares the CPU with the app, so on small machines the first round of cold
+polls still has a tail of a few seconds. The signin spike is expected to fail some requests:
+anything beyond PASSWORD_HASH_WORKERS plus PASSWORD_HASH_MAX_QUEUE is shed with a 503, and the
+requests that were admitted wait for up to about (workers + queue) * bcrypt time / cores.
+No other scenario should report errors.
+
+Baselines are machine-specific, so record one before comparing on new hardware:
+
+    alembic upgrade head
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python -m benchmarks.load --save-baseline benchmarks/load_baseline.json
+    python -m benchmarks.load --scenario quotes --scenario charts
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+FAKE_ALPACA_PORT = int(os.environ.get("FAKE_ALPACA_PORT", "9181"))
+EXTERNAL_ALPACA = "ALPACA_DATA_BASE" in os.environ
+os.environ.setdefault("ALPACA_DATA_BASE", f"http://127.0.0.1:{FAKE_ALPACA_PORT}")
+os.environ.setdefault("ALPACA_TRADE_BASE", f"http://127.0.0.1:{FAKE_ALPACA_PORT}")
+os.environ.setdefault("ALPACA_HTTP2", "false")
+os.environ.setdefault("PREWARM_ENABLED", "false")
+# The fake upstream has no quota and all simulated clients share one address, so both limiters
+# are lifted unless set explicitly.
+for limit in ("ALPACA_RATE_LIMIT", "MARKET_RATE_LIMIT"):
+    os.environ.setdefault(f"{limit}_PER_MINUTE", "1000000000")
+    os.environ.setdefault(f"{limit}_BURST", "1000000000")
+
+import fakeredis.aioredis  # noqa: E402
+import httpx  # noqa: E402
+from sqlalchemy import delete, insert, select  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.security import create_token, hash_password  # noqa: E402
+from app.db.session import get_sessionmaker  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Bar, BarSeries, User, WatchlistItem  # noqa: E402
+from app.services import redis_client  # noqa: E402
+from app.services.charts import ChartSpec  # noqa: E402
+from benchmarks.fake_alpaca import FakeAlpacaServer, asset_universe  # noqa: E402
+
+SCENARIOS = ("search", "quotes", "charts", "signin", "watchlist")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "load_baseline.json")
+EMAIL_PATTERN = "bench-load-{}@example.com"
+PASSWORD = "bench-load-password"
+SYMBOL_PREFIX = "ZB"
+ASSETS = 2000
+# Share of failed requests, in absolute terms, a scenario may gain over the baseline.
+ERROR_RATE_TOLERANCE = 0.02
+
+
+class Result:
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.elapsed = 0.0
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[response.status_code] += 1
+        return response
+
+    def summary(self) -> Dict[str, object]:
+        cuts = statistics.quantiles(self.latencies, n=100) if len(self.latencies) > 1 else [0.0] * 99
+        errors = {str(code): count for code, count in sorted(self.statuses.items()) if code >= 400}
+        return {
+            "requests": len(self.latencies),
+            "errors": errors,
+            "throughput": round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(cuts[49] * 1000, 2),
+            "p95_ms": round(cuts[94] * 1000, 2),
+            "p99_ms": round(cuts[98] * 1000, 2),
+        }
+
+
+async def timed(run: Callable[[Result], Awaitable[None]]) -> Result:
+    result = Result()
+    started = time.perf_counter()
+    await run(result)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def search(client: httpx.AsyncClient, args: argparse.Namespace) -> Result:
+    names = [asset["name"] for asset in asset_universe(ASSETS)]
+    await client.get("/api/market/search", params={"q": "a"})  # loads the asset index
+
+    async def typist(result: Result) -> None:
+        for _ in range(args.words):
+            word = random.choice(names)
+            for length in range(1, min(len(word), 8) + 1):
+                await result.request(client, "GET", "/api/market/search", params={"q": word[:length]})
+                await asyncio.sleep(args.keystroke_ms / 1000)
+
+    return await timed(lambda result: asyncio.gather(*(typist(result) for _ in range(args.clients))))
+
+
+async def quotes(client: httpx.AsyncClient, args: argparse.Namespace) -> Result:
+    universe = [asset["symbol"] for asset in asset_universe(args.symbols)]
+
+    async def poller(result: Result) -> None:
+        symbols = ",".join(random.sample(universe, min(10, len(universe))))
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            await result.request(client, "GET", "/api/market/quotes", params={"symbols": symbols})
+            await asyncio.sleep(args.poll_interval)
+
+    return await timed(lambda result: asyncio.gather(*(poller(result) for _ in range(args.clients))))
+
+
+async def charts(client: httpx.AsyncClient, args: argparse.Namespace) -> Result:
+    universe = [asset["symbol"] for asset in asset_universe(args.symbols)][:40]
+    semaphore = asyncio.Semaphore(4)
+
+    async def warm(symbol: str) -> None:
+        async with semaphore:
+            await client.get("/api/market/chart", params={"symbol": symbol})
+
+    # Fills the bar store first, so the storm measures cache misses rather than backfills.
+    await asyncio.gather(*(warm(symbol) for symbol in universe))
+
+    async def storm(result: Result) -> None:
+        for _ in range(args.rounds):
+            await redis_client.get_redis_client().delete(*(ChartSpec(symbol).cache_key for symbol in universe))
+            redis_client.local_cache.clear()
+            await asyncio.gather(
+                *(
+                    result.request(client, "GET", "/api/market/chart", params={"symbol": random.choice(universe)})
+                    for _ in range(args.clients)
+                )
+            )
+
+    return await timed(storm)
+
+
+async def signin(client: httpx.AsyncClient, args: argparse.Namespace) -> Result:
+    async def spike(result: Result) -> None:
+        for _ in range(args.rounds):
+            await asyncio.gather(
+                *(
+                    result.request(
+                        client, "POST", "/auth/signin", json={"email": EMAIL_PATTERN.format(i), "password": PASSWORD}
+                    )
+                    for i in range(args.clients)
+                )
+            )
+
+    return await timed(spike)
+
+
+async def watchlist(client: httpx.AsyncClient, args: argparse.Namespace, user_ids: List[int]) -> Result:
+    async def poller(result: Result, user_id: int) -> None:
+        headers = {"Cookie": f"access_token={create_token(str(user_id), settings.access_token_expire_minutes)}"}
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            response = await result.request(client, "GET", "/api/watchlist", headers=headers)
+            if "etag" in response.headers:
+                headers["If-None-Match"] = response.headers["etag"]
+            await result.request(client, "GET", "/api/watchlist/snapshot", headers=headers)
+            await asyncio.sleep(args.poll_interval)
+
+    return await timed(lambda result: asyncio.gather(*(poller(result, user_id) for user_id in user_ids)))
+
+
+async def cleanup() -> None:
+    async with get_sessionmaker()() as session:
+        users = select(User.id).where(User.email.like(EMAIL_PATTERN.format("%")))
+        await session.execute(delete(WatchlistItem).where(WatchlistItem.user_id.in_(users)))
+        await session.execute(delete(User).where(User.email.like(EMAIL_PATTERN.format("%"))))
+        await session.execute(delete(Bar).where(Bar.symbol.like(f"{SYMBOL_PREFIX}%")))
+        await session.execute(delete(BarSeries).where(BarSeries.symbol.like(f"{SYMBOL_PREFIX}%")))
+        await session.commit()
+
+
+async def seed_users(count: int, symbols: int) -> List[int]:
+    hashed = hash_password(PASSWORD)
+    universe = [asset["symbol"] for asset in asset_universe(symbols)]
+    async with get_sessionmaker()() as session:
+        user_ids = list(
+            await session.scalars(
+                insert(User).returning(User.id),
+                [{"email": EMAIL_PATTERN.format(i), "hashed_password": hashed} for i in range(count)],
+            )
+        )
+        rows = [
+            {"user_id": user_id, "symbol": symbol}
+            for user_id in user_ids
+            for symbol in random.sample(universe, min(20, len(universe)))
+        ]
+        await session.execute(insert(WatchlistItem), rows)
+        await session.commit()
+    return user_ids
+
+
+def _error_rate(summary: Dict[str, object]) -> float:
+    return sum(summary["errors"].values()) / summary["requests"] if summary["requests"] else 0.0
+
+
+def report(results: Dict[str, Dict[str, object]], baseline: Optional[dict], tolerance: float) -> bool:
+    """Print the results next to the baseline; returns whether any scenario regressed."""
+    regressed = False
+    previous = (baseline or {}).get("scenarios", {})
+    print(f"{'scenario':<10} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  errors")
+    for name, summary in results.items():
+        errors = ", ".join(f"{code}x{count}" for code, count in summary["errors"].items()) or "-"
+        print(
+            f"{name:<10} {summary['requests']:>9} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.2f} "
+            f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}  {errors}"
+        )
+        base = previous.get(name)
+        if base is None:
+            continue
+        p95_change = summary["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_change = summary["throughput"] / base["throughput"] - 1 if base["throughput"] else 0.0
+        error_change = _error_rate(summary) - _error_rate(base)
+        worse = p95_change > tolerance or rps_change < -tolerance or error_change > ERROR_RATE_TOLERANCE
+        regressed |= worse
+        verdict = "REGRESSION" if worse else "ok"
+        print(
+            f"{'':<10} vs baseline: p95 {p95_change:+.0%}, throughput {rps_change:+.0%}, "
+            f"errors {error_change:+.1%}  {verdict}"
+        )
+    return regressed
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, object]]:
+    if not args.real_redis:
+        redis_client._client = fakeredis.aioredis.FakeRedis()
+    results: Dict[str, Dict[str, object]] = {}
+    async with AsyncExitStack() as stack:
+        if not EXTERNAL_ALPACA:
+            await stack.enter_async_context(
+                FakeAlpacaServer(
+                    FAKE_ALPACA_PORT,
+                    latency_ms=args.upstream_latency_ms,
+                    jitter_ms=args.upstream_jitter_ms,
+                    error_rate=args.upstream_error_rate,
+                    assets=ASSETS,
+                )
+            )
+        await stack.enter_async_context(app.router.lifespan_context(app))
+        await cleanup()
+        stack.push_async_callback(cleanup)
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        client = await stack.enter_async_context(httpx.AsyncClient(transport=transport, base_url="http://bench"))
+        user_ids = await seed_users(args.clients, args.symbols)
+        scenarios = {
+            "search": lambda: search(client, args),
+            "quotes": lambda: quotes(client, args),
+            "charts": lambda: charts(client, args),
+            "signin": lambda: signin(client, args),
+            "watchlist": lambda: watchlist(client, args, user_ids),
+        }
+        for name in args.scenario or SCENARIOS:
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = (await scenarios[name]()).summary()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repeat to run several (default all)")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--symbols", type=int, default=200, help="Size of the symbol universe clients draw from")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds each polling scenario runs")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--keystroke-ms", type=float, default=40.0)
+    parser.add_argument("--words", type=int, default=3, help="Words each search client types")
+    parser.add_argument("--rounds", type=int, default=3, help="Chart expiries and signin spikes")
+    parser.add_argument("--upstream-latency-ms", type=float, default=40.0)
+    parser.add_argument("--upstream-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--real-redis", action="store_true", help="Use REDIS_URL instead of fakeredis")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 increase / throughput drop")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("options") != _options(args):
+            print("note: baseline was recorded with different options", file=sys.stderr)
+    regressed = report(results, baseline, args.tolerance)
+    if args.save_baseline:
+        recorded = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "machine": f"{platform.machine()} {platform.python_implementation()} {platform.python_version()}",
+            "options": _options(args),
+            "scenarios": results,
+        }
+        with open(args.save_baseline, "w") as f:
+            json.dump(recorded, f, indent=2)
+            f.write("\n")
+    sys.exit(1 if regressed else 0)
+
+
+def _options(args: argparse.Namespace) -> Dict[str, object]:
+    ignored = {"scenario", "baseline", "save_baseline", "tolerance"}
+    return {key: value for key, value in sorted(vars(args).items()) if key not in ignored}
+
+
+if __name__ == "__main__":
+    main()
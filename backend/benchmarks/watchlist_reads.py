@@ -0,0 +1,119 @@
+"""
+Watchlist read latency for users with large lists, without and with ix_watchlist_user_created.
+
+Seeds users with thousands of symbols each into the database at DATABASE_URL (migrated to head),
+then times the query behind GET /api/watchlist on a cache miss, as seen by the app (client) and
+as reported by EXPLAIN ANALYZE (server). The index is dropped for the
+"before" run and recreated (plus VACUUM ANALYZE, which index-only scans need) for "after".
+Seeded rows are removed at the end, and the index is left in place. Use a scratch database.
+
+    alembic upgrade head
+    python -m benchmarks.watchlist_reads --users 20 --symbols 2000 --reads 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import List, Tuple
+
+from sqlalchemy import delete, insert, select, text
+
+from app.api.routes.watchlist import load_symbols
+from app.db.session import get_engine, get_sessionmaker
+from app.models import User, WatchlistItem
+
+EMAIL_PATTERN = "bench-watchlist-{}@example.com"
+INDEX_NAME = "ix_watchlist_user_created"
+
+
+async def seed(users: int, symbols: int) -> List[int]:
+    async with get_sessionmaker()() as session:
+        user_ids = list(
+            await session.scalars(
+                insert(User).returning(User.id),
+                [{"email": EMAIL_PATTERN.format(i), "hashed_password": "-"} for i in range(users)],
+            )
+        )
+        rows = [{"user_id": user_id, "symbol": f"S{n:05d}"} for user_id in user_ids for n in range(symbols)]
+        for offset in range(0, len(rows), 5000):
+            await session.execute(insert(WatchlistItem), rows[offset : offset + 5000])
+        await session.commit()
+    return user_ids
+
+
+async def cleanup(user_ids: List[int]) -> None:
+    async with get_sessionmaker()() as session:
+        await session.execute(delete(WatchlistItem).where(WatchlistItem.user_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def set_index(enabled: bool) -> None:
+    async with get_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        if enabled:
+            index = next(index for index in WatchlistItem.__table__.indexes if index.name == INDEX_NAME)
+            await conn.run_sync(index.create)
+        await conn.execute(text("VACUUM ANALYZE watchlist_items"))
+
+
+async def explain(user_id: int) -> Tuple[str, float]:
+    """The plan for one user's read, and its server-side execution time in milliseconds."""
+    query = (
+        select(WatchlistItem.symbol).where(WatchlistItem.user_id == user_id).order_by(WatchlistItem.created_at.desc())
+    )
+    async with get_engine().connect() as conn:
+        compiled = query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        lines = [row[0].strip() for row in await conn.execute(text(f"EXPLAIN (ANALYZE, COSTS OFF) {compiled}"))]
+    execution_ms = next(float(line.split()[2]) for line in lines if line.startswith("Execution Time"))
+    return " | ".join(line for line in lines if not line.startswith(("Planning", "Execution"))), execution_ms
+
+
+async def measure(user_ids: List[int], reads: int, concurrency: int) -> List[float]:
+    sessionmaker = get_sessionmaker()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one() -> None:
+        async with semaphore, sessionmaker() as session:
+            started = time.perf_counter()
+            await load_symbols(session, random.choice(user_ids))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(min(100, reads))))
+    latencies.clear()
+    await asyncio.gather(*(one() for _ in range(reads)))
+    return latencies
+
+
+def summarize(latencies: List[float]) -> str:
+    cuts = statistics.quantiles(latencies, n=100)
+    return f"p50 {cuts[49] * 1000:7.2f} ms   p95 {cuts[94] * 1000:7.2f} ms   p99 {cuts[98] * 1000:7.2f} ms"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+
+    user_ids = await seed(args.users, args.symbols)
+    try:
+        for label, enabled in (("before", False), ("after", True)):
+            await set_index(enabled)
+            latencies = await measure(user_ids, args.reads, args.concurrency)
+            explained = [await explain(user_id) for user_id in user_ids]
+            print(f"{label:<7} client  {summarize(latencies)}")
+            print(f"        server  {summarize([execution_ms / 1000 for _, execution_ms in explained])}")
+            print(f"        plan: {explained[0][0]}")
+    finally:
+        await cleanup(user_ids)
+        await get_engine().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -63,6 +63,7 @@ export interface MarketSearchResponse {
 export interface QuoteEntry {
   symbol: string;
   last: number | null;
+  mid?: number | null;
   bid: number | null;
   ask: number | null;
   changePct: number | null;